@@ -1,9 +1,11 @@
-from flask_alcohol import APIMixin, route, APIMeta, authorizes, setter, getter, adjusts_query, extra_field
-from flask import Flask, jsonify, request, abort, current_app, flash, g
+from flask_alcohol import APIMixin, route, APIMeta, authorizes, setter, getter, adjusts_query, extra_field, cache_key, \
+    APIMetrics, APIBatch
+from flask import Flask, jsonify, request, abort, current_app, flash, g, has_request_context
 from flask.ext.sqlalchemy import SQLAlchemy
 from flask.ext.login import current_user, UserMixin, LoginManager, AnonymousUserMixin, login_user
 from datetime import datetime
 from sqlalchemy.dialects.postgres import ARRAY, JSONB
+from sqlalchemy import bindparam, func
 from sqlalchemy.ext.hybrid import hybrid_property
 from werkzeug.security import generate_password_hash, check_password_hash
 from string import ascii_lowercase, digits
@@ -21,7 +23,12 @@ app.config.update(
     SQLALCHEMY_ECHO=False,
     # Flask-Alcohol settings
     ROUTE_PREFIX='api',
-    API_ERROR_MESSAGE='Please contact nat.foster@gmail.com for help'
+    API_ERROR_MESSAGE='Please contact nat.foster@gmail.com for help',
+    # cache index, get, and meta responses in process until a write touches their tables
+    ALCOHOL_CACHE=True,
+    # collect per route timings for /api/metrics and send them back in a Server-Timing header
+    ALCOHOL_METRICS=True,
+    ALCOHOL_SERVER_TIMING=True
 )
 
 
@@ -66,6 +73,12 @@ def url_safe_string(str):
     return ''.join(chars)
 
 
+def get_preview_chars():
+    if has_request_context():
+        return int(request.args.get('preview_chars') or current_app.config.get('PREVIEW_CHARS'))
+    return PREVIEW_CHARS
+
+
 def media_url(filename):
     return '/{0}/{1}'.format(MEDIA_DIR, filename)
 
@@ -99,6 +112,8 @@ def image_url_array(dirname):
 class User(db.Model, UserMixin, APIMixin):
     __tablename__ = 'users'
     __autoroutes__ = ['index', 'meta']
+    # more_json reads these, so keep loading them when a request asks for only some fields
+    __requiredfields__ = ['first_name', 'last_name', 'profile_picture', 'roles']
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.Unicode, nullable=False, default='', index=True)
@@ -182,7 +197,7 @@ class Project(db.Model, APIMixin):
 
     @slug.setter
     def slug(self, value):
-        value = request.json.get('slug') or request.json.get('title')
+        value = g.fields.get('slug') or g.fields.get('title')
         slug = url_safe_string(value)[:50]
         if slug != self._slug and self.__class__.query.filter_by(slug=slug).first():
             g.failed_validation = True
@@ -197,14 +212,14 @@ class Project(db.Model, APIMixin):
         else:
             self.theme = value
 
-    @setter('images')
+    @setter('images', depends_on=['image_dir'])
     def set_images(self, name, value):
         self.images = image_url_dict(self.image_dir)
 
 
 class Post(db.Model, APIMixin):
     __tablename__ = 'posts'
-    __autoroutes__ = ['index', 'get', 'post', 'put', 'delete', 'meta']
+    __autoroutes__ = ['index', 'get', 'post', 'put', 'delete', 'meta', 'bulk_post', 'bulk_put', 'bulk_delete']
     __idattr__ = 'slug'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -222,7 +237,8 @@ class Post(db.Model, APIMixin):
 
     project = db.relationship('Project', lazy='joined', info={'public': True})
 
-    @extra_field(info={'defer': True})
+    # rescanning the body is only needed when the post or ?preview_chars= changes
+    @extra_field(info={'defer': True}, requires=['body'], memoize='app', vary=get_preview_chars)
     def preview(self, *args):
         preview_chars = int(request.args.get('preview_chars') or current_app.config.get('PREVIEW_CHARS'))
         if len(self.body) > preview_chars:
@@ -232,23 +248,24 @@ class Post(db.Model, APIMixin):
         else:
             return self.body
 
-    @extra_field(info={'defer': True})
+    # computed by the database, so the body doesn't have to be loaded to tell if it is cut
+    @extra_field(info={'defer': True}, expression=lambda cls: func.length(cls.body) > bindparam(
+        'preview_chars', callable_=get_preview_chars, type_=db.Integer))
     def is_cut(self, *args):
-        preview_chars = int(request.args.get('preview_chars') or current_app.config.get('PREVIEW_CHARS'))
-        return len(self.body) > preview_chars
+        return len(self.body) > get_preview_chars()
 
-    @setter('slug')
+    @setter('slug', depends_on=['slug', 'title'])
     def set_slug(self, name, value):
         # validates slug exists and is unique
-        value = request.json.get('slug') or request.json.get('title')
+        value = g.fields.get('slug') or g.fields.get('title')
         slug = url_safe_string(value)[:50]
-        if slug != self.slug and self.__class__.query.filter_by(slug=slug).first():
+        if not self._is_unique('slug', slug):
             g.failed_validation = True
             flash('This slug is not unique')
             return None
         self.slug = slug
 
-    @setter('images')
+    @setter('images', depends_on=['image_dir'])
     def set_images(self, name, value):
         print('setting images for post')
         self.images = image_url_dict(self.image_dir)
@@ -258,10 +275,10 @@ class Post(db.Model, APIMixin):
         val = getattr(self, name)
         return val.isoformat()
 
-    @setter('last_published_at')
+    @setter('last_published_at', depends_on=['publish'])
     def set_last_published_at(self, name, value):
         now = datetime.utcnow()
-        if request.json.get('publish'):
+        if g.fields.get('publish'):
             self.last_published_at = now
         else:
             self.last_published_at = None
@@ -281,6 +298,12 @@ class Post(db.Model, APIMixin):
             query = query.filter(Post.project_id == project_id)
         return query
 
+    # relevant_posts depends on the user, so cached responses have to as well
+    @staticmethod
+    @cache_key('get', 'index')
+    def cache_by_role():
+        return current_user.is_admin()
+
 
 class Gallery(db.Model, APIMixin):
     __tablename__ = 'galleries'
@@ -292,7 +315,7 @@ class Gallery(db.Model, APIMixin):
     image_dir = db.Column(db.Unicode, nullable=False, default='', info={'set_by': 'json'})
     images = db.Column(ARRAY(db.Unicode), nullable=False, default=[], info={'set_by': 'server'})
 
-    @setter('images')
+    @setter('images', depends_on=['image_dir'])
     def set_images(self, name, value):
         self.images = image_url_array(self.image_dir)
 
@@ -307,6 +330,8 @@ Project.register(app)
 Post.register(app)
 Gallery.register(app)
 APIMeta.register(app)
+APIMetrics.register(app)
+APIBatch.register(app)
 
 
 if __name__ == '__main__':
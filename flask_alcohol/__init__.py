@@ -10,15 +10,70 @@
 __version__ = '0.2.2'
 
 
-from flask import request, jsonify, make_response, current_app, Response, get_flashed_messages, g, flash
-from sqlalchemy.orm import class_mapper, joinedload
+from flask import request, make_response, current_app, Response, get_flashed_messages, g, flash, \
+    stream_with_context, session as flask_session, has_app_context, has_request_context
+from sqlalchemy import and_, or_, func, event, select, update, delete, Column
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, DBAPIError
+from sqlalchemy.orm import class_mapper, object_mapper, joinedload, selectinload, subqueryload, defaultload, \
+    load_only, undefer, lazyload, column_property, sessionmaker, Session as OrmSession
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.orm.exc import UnmappedInstanceError
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.properties import ColumnProperty
+from sqlalchemy.sql.expression import ClauseElement
 from sqlalchemy.orm.collections import InstrumentedList
 from werkzeug.routing import parse_rule
+from werkzeug.test import EnvironBuilder
+import asyncio
+import base64
+import collections
+import contextlib
+import copy
+import datetime
+import decimal
 import inspect
 import functools
+import hashlib
+import importlib
+import itertools
+import json
+import operator
+import os
+import pickle
 import re
+import sys
+import threading
+import time
+import uuid
+
+
+# as_dict plans are cached per set of included fields, this keeps arbitrary
+# combinations of only/include/defer from growing the cache forever
+MAX_CACHED_PLANS = 128
+
+LOADERS = {
+    'joined': joinedload,
+    'selectin': selectinload,
+    'subquery': subqueryload
+}
+
+# ways index can find the total for a page, None keeps the separate COUNT query from paginate
+COUNT_STRATEGIES = (None, 'exact', 'estimated', 'none')
+
+# bump this when the contents of a registry change so old snapshots are ignored
+REGISTRY_VERSION = 3
+
+FILTER_OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le
+}
+
+# what a dotted only/include/defer path asks of a relationship: the fields of the related model,
+# the more_json keys to keep (None keeps all of them) and (relationship, FieldSpec) pairs below it
+FieldSpec = collections.namedtuple('FieldSpec', ['fields', 'extras', 'nested'])
 
 
 def route(rule, **options):
@@ -26,7 +81,8 @@ def route(rule, **options):
     A decorator that is used to define custom routes for methods in
     Router subclasses. The format is exactly the same as Flask's
     `@app.route` decorator except that it supports an is_auto kwarg that
-    APIMixin uses for autoroutes.
+    APIMixin uses for autoroutes, and a read_only kwarg that sends the route's
+    queries to a replica when ALCOHOL_READ_REPLICAS is set.
     """
     try:
         is_auto = bool(options.pop('is_auto'))
@@ -62,6 +118,38 @@ def authorizes(*route_names):
     return decorator
 
 
+def authorizes_rows(*route_names):
+    """
+    Decorates a static method that returns a SQLAlchemy criterion limiting which rows the current
+    user may see on any number of routes, or None for no limit. The criterion is added to the
+    index, get, put and delete queries so the database does the filtering, and rows it leaves
+    out are not found.
+    """
+
+    def decorator(f):
+        # Put the check cache on the method itself instead of globally
+        f._rows_cache = route_names
+        return f
+
+    return decorator
+
+
+def authorizes_batch(*route_names):
+    """
+    Decorates a static method that takes a list of resources and returns the ones the current
+    user may access, or True or False for all of them. It is called once per request with every
+    fetched object. index leaves out the rest, single object routes return 403 and bulk routes
+    report 403 for those items.
+    """
+
+    def decorator(f):
+        # Put the check cache on the method itself instead of globally
+        f._batch_cache = route_names
+        return f
+
+    return decorator
+
+
 def before_return(*route_names):
     """
     Decorates a static method that takes the resource and executes custom code before committing changes
@@ -89,45 +177,900 @@ def adjusts_query(*route_names):
     return decorator
 
 
-def setter(*field_names):
+def cache_key(*route_names):
     """
-    Decorates a method that validates and sets any number of fields in the object
+    Decorates a static method that returns extra values for the response cache key of any number
+    of read routes, for routes whose output depends on more than the url, like the current user.
+    Read routes with @authorizes_rows, @authorizes_batch, @adjusts_query or @before_return hooks
+    are only cached if they also have one.
+    """
+
+    def decorator(f):
+        # Put the check cache on the method itself instead of globally
+        f._cachekey_cache = route_names
+        return f
+
+    return decorator
+
+
+def setter(*field_names, **options):
+    """
+    Decorates a method that validates and sets any number of fields in the object.
+    Pass depends_on=[...] to name the request fields a server set field is computed from,
+    so that updates only run the setter when one of them is sent. Without it the setter runs
+    on every write. Setters always run when the object is created.
     """
 
     def decorator(f):
         # Put the check cache on the method itself instead of globally
         f._setter_cache = field_names
+        depends_on = options.get('depends_on')
+        f._depends_cache = tuple(depends_on) if depends_on is not None else None
         return f
 
     return decorator
 
 
-def getter(*field_names):
+def getter(*field_names, **options):
     """
-    Decorates a method that returns a transformed value for any number of fields in the object
+    Decorates a method that returns a transformed value for any number of fields in the object.
+    Pass requires=[...] to name other fields the getter reads so they are loaded from the database.
+    Pass memoize='request' or memoize='app' to compute the value once per row, see _memoize.
     """
 
     def decorator(f):
         # Put the check cache on the method itself instead of globally
         f._getter_cache = field_names
+        f._requires_cache = tuple(options.get('requires') or ())
+        f._memoize_cache = _memoize_options(**options)
         return f
 
     return decorator
 
 
-def extra_field(info=None):
+def extra_field(info=None, requires=None, expression=None, memoize=None, vary=None, timeout=None):
     """
-    Decorates a method that represents an extra field in the json
+    Decorates a method that represents an extra field in the json. requires names the fields
+    the method reads so they are loaded from the database when the extra field is included.
+
+    expression computes the field in the database instead. It is a SQL expression, or a function
+    that takes the class and returns one, e.g. lambda cls: func.length(cls.body) > 300. It is
+    mapped as a column property that is only selected when the field is included, and the method
+    is then only called for objects that haven't been saved yet. Use bindparam with callable_ for
+    values that depend on the request.
+
+    memoize, vary and timeout work like they do for @getter.
     """
 
     def decorator(f):
         # Put the check cache on the method itself instead of globally
         f._extra_cache = info or {}
+        f._requires_cache = tuple(requires or ())
+        f._expression_cache = expression
+        f._memoize_cache = _memoize_options(memoize=memoize, vary=vary, timeout=timeout)
         return f
 
     return decorator
 
 
+def _memoize_options(memoize=None, vary=None, timeout=None, **options):
+    if memoize is None:
+        return None
+    if memoize not in ('request', 'app'):
+        raise ValueError('memoize must be request or app, not {0}'.format(memoize))
+    return {'scope': memoize, 'vary': vary, 'timeout': timeout}
+
+
+def _memoize(accessor, cls, name, scope, vary=None, timeout=None):
+    """
+    Wraps a getter's accessor so its value is computed once per row. The key is the model, the
+    field, the primary key, the __versionattr__ value if the model has one, and whatever vary()
+    returns, for values that also depend on the request like a query argument.
+
+    With the request scope values are kept on g for the rest of the request. With the app scope
+    they are kept in an LRU cache shared by every request, and dropped after timeout seconds
+    (ALCOHOL_MEMO_TIMEOUT by default). Without a version column the key has the generation of
+    the model's table instead, so any write to the table through this process drops its values,
+    and writes by other processes show up after the timeout. Cached values are shared, so they
+    shouldn't be changed in place, and the cache is skipped while the session has uncommitted
+    writes.
+    """
+    model_key = cls.__module__ + '.' + cls.__name__
+    version_attr = cls.__versionattr__
+    table = cls.__table__.name
+    if scope == 'app' and not version_attr:
+        _listen_for_writes()
+
+    def memoized(obj):
+        identity = instance_state(obj).identity
+        if identity is None or not has_app_context():
+            return accessor(obj)
+        key = (model_key, name, identity)
+        if version_attr:
+            key += (getattr(obj, version_attr),)
+        if vary is not None:
+            key += (vary(),)
+        if scope == 'request':
+            try:
+                memo = g.alcohol_memo
+            except AttributeError:
+                memo = g.alcohol_memo = {}
+            try:
+                return memo[key]
+            except KeyError:
+                value = memo[key] = accessor(obj)
+                return value
+        cache = current_app.extensions.get('alcohol_memo')
+        if cache is None or _has_uncommitted_writes(instance_state(obj).session):
+            return accessor(obj)
+        if not version_attr:
+            key += (_get_generation(cache, table),)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0]
+        value = accessor(obj)
+        # wrapped so that None can be cached too
+        cache.set(key, (value,), timeout)
+        return value
+
+    return memoized
+
+
+def _takes_field_name(func):
+    """
+    Getters and extra fields can be written as func(self) or func(self, name). Figure out which
+    one once at registration instead of catching a TypeError on every call.
+    """
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        return True
+    try:
+        signature.bind(None, None)
+    except TypeError:
+        return False
+    return True
+
+
+def _make_getter_accessor(func, name):
+    if _takes_field_name(func):
+        return lambda obj: func(obj, name)
+    return func
+
+
+def _make_sql_field_accessor(key, fallback):
+    def accessor(obj):
+        try:
+            return obj.__dict__[key]
+        except KeyError:
+            pass
+        if instance_state(obj).has_identity:
+            # loads the deferred column property
+            return getattr(obj, key)
+        return fallback(obj)
+    return accessor
+
+
+def _make_relationship_accessor(name, uselist):
+    if uselist:
+        def accessor(obj):
+            return [x.as_dict(use_defaults=True) for x in getattr(obj, name)]
+    else:
+        def accessor(obj):
+            value = getattr(obj, name)
+            if value is None:
+                return None
+            return value.as_dict(use_defaults=True)
+    return accessor
+
+
+def _make_nested_accessor(name, uselist, plan, extras):
+    """
+    Serializes a relationship with the plan of a dotted only/include/defer path instead of the
+    default fields of the related model.
+    """
+    if uselist:
+        def accessor(obj):
+            return [x._serialize(plan, extras) for x in getattr(obj, name)]
+    else:
+        def accessor(obj):
+            value = getattr(obj, name)
+            if value is None:
+                return None
+            return value._serialize(plan, extras)
+    return accessor
+
+
+def _parse_field_paths(value):
+    """
+    Turns 'title,author.first_name,author.projects.name' from only, include or defer into
+    {'title': {}, 'author': {'first_name': {}, 'projects': {'name': {}}}}.
+    """
+    tree = {}
+    if not value:
+        return tree
+    for path in value.split(','):
+        node = tree
+        for part in path.split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def _coerce_value(column, value):
+    """
+    Converts a value from a request argument or a cursor to the python type of the column.
+    Raises ValueError if it can't be converted.
+    """
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if isinstance(value, python_type):
+        return value
+    if python_type is bool:
+        if str(value).lower() in ('true', '1', 'yes'):
+            return True
+        if str(value).lower() in ('false', '0', 'no'):
+            return False
+        raise ValueError('Not a boolean: {0}'.format(value))
+    if python_type is datetime.datetime:
+        return datetime.datetime.fromisoformat(value)
+    if python_type is datetime.date:
+        return datetime.date.fromisoformat(value)
+    if python_type is datetime.time:
+        return datetime.time.fromisoformat(value)
+    if python_type in (int, float, decimal.Decimal, str):
+        return python_type(value)
+    return value
+
+
+def _encode_cursor(values):
+    def default(value):
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        raise TypeError('Cannot put {0!r} in a cursor'.format(value))
+    raw = json.dumps(values, default=default, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor, columns):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (UnicodeError, base64.binascii.Error):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    return [_coerce_value(column, value) for column, value in zip(columns, values)]
+
+
+def _keyset_criterion(sort_columns, values):
+    """
+    Builds (a > x) OR (a = x AND b > y) OR ... for the sort columns, respecting each direction.
+    """
+    clauses = []
+    for idx, (name, col, desc) in enumerate(sort_columns):
+        equal = [sort_columns[i][1] == values[i] for i in range(idx)]
+        beyond = col < values[idx] if desc else col > values[idx]
+        clauses.append(and_(*(equal + [beyond])))
+    return or_(*clauses)
+
+
+def _flash_count():
+    return len(flask_session.get('_flashes', ()))
+
+
+def _flashes_since(start):
+    """
+    Returns the messages flashed after start. Bulk routes use this to report messages per item,
+    since get_flashed_messages only reads the session once per request.
+    """
+    return [message for category, message in flask_session.get('_flashes', ())[start:]]
+
+
+def _clear_flashes():
+    if '_flashes' in flask_session:
+        flask_session.pop('_flashes')
+
+
+class SimpleCache(object):
+    """
+    In process LRU cache with a time to live. This is the default backend for the response
+    cache, other backends need the same get, set, and delete methods.
+    """
+
+    def __init__(self, max_size=1000, default_timeout=300):
+        self.max_size = max_size
+        self.default_timeout = default_timeout
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._items[key]
+            except KeyError:
+                return None
+            if expires is not None and expires < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._items[key] = (expires, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+def _make_cache(config):
+    cache = config.get('ALCOHOL_CACHE')
+    if not cache:
+        return None
+    if cache is True or cache == 'simple':
+        return SimpleCache(config['ALCOHOL_CACHE_SIZE'], config['ALCOHOL_CACHE_TIMEOUT'])
+    return cache
+
+
+def _get_generation(cache, table):
+    """
+    Every table has a generation token in the cache that is part of the keys of responses
+    that read from it. A missing token gets a new random value so an evicted token can never
+    bring back stale responses.
+    """
+    key = 'alcohol:generation:' + table
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.set(key, generation, 0)
+    return generation
+
+
+def _invalidate_tables(cache, tables):
+    for table in tables:
+        cache.set('alcohol:generation:' + table, uuid.uuid4().hex, 0)
+
+
+def _collect_written_tables(session, flush_context):
+    tables = session.info.setdefault('alcohol_written_tables', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        try:
+            tables.update(table.name for table in object_mapper(obj).tables)
+        except UnmappedInstanceError:
+            pass
+
+
+def _invalidate_written_tables(session):
+    if session.in_nested_transaction():
+        # releasing a savepoint, the tables are invalidated when the outer transaction commits
+        return
+    tables = session.info.pop('alcohol_written_tables', None)
+    if tables and has_app_context():
+        for extension in ('alcohol_cache', 'alcohol_memo'):
+            cache = current_app.extensions.get(extension)
+            if cache is not None:
+                _invalidate_tables(cache, tables)
+
+
+def _has_uncommitted_writes(session):
+    # values read inside an open write transaction may never be committed
+    return session is not None and bool(session.info.get('alcohol_written_tables'))
+
+
+def _forget_written_tables(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('alcohol_written_tables', None)
+
+
+def _invalidate_bulk_write(update_context):
+    # query.update() and query.delete() don't go through the flush
+    tables = [table.name for table in update_context.mapper.tables]
+    update_context.session.info.setdefault('alcohol_written_tables', set()).update(tables)
+    if has_app_context():
+        for extension in ('alcohol_cache', 'alcohol_memo'):
+            cache = current_app.extensions.get(extension)
+            if cache is not None:
+                _invalidate_tables(cache, tables)
+
+
+def _listen_for_writes():
+    """
+    Invalidates cached responses for every table written by any session once it commits.
+    """
+    if event.contains(OrmSession, 'after_flush', _collect_written_tables):
+        return
+    event.listen(OrmSession, 'after_flush', _collect_written_tables)
+    event.listen(OrmSession, 'after_commit', _invalidate_written_tables)
+    event.listen(OrmSession, 'after_rollback', _forget_written_tables)
+    event.listen(OrmSession, 'after_bulk_update', _invalidate_bulk_write)
+    event.listen(OrmSession, 'after_bulk_delete', _invalidate_bulk_write)
+
+
+class ReplicaRouter(object):
+    """
+    Picks the replica bind that a read only request is sent to, in turn with 'round_robin' or
+    the one with the fewest requests in flight with 'least_connections', and makes sessions
+    on it.
+    """
+
+    STRATEGIES = ('round_robin', 'least_connections')
+
+    def __init__(self, engines, strategy='round_robin'):
+        if not engines:
+            raise ValueError('ReplicaRouter needs at least one replica')
+        if strategy not in self.STRATEGIES:
+            raise ValueError('Unknown replica strategy {0}'.format(strategy))
+        self.binds = sorted(engines)
+        self.strategy = strategy
+        self._factories = dict((bind, sessionmaker(bind=engine)) for bind, engine in engines.items())
+        self._in_flight = dict.fromkeys(self.binds, 0)
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns the chosen bind and a new session on it. Call release with the bind when the
+        session is closed.
+        """
+        with self._lock:
+            start = next(self._turn) % len(self.binds)
+            binds = self.binds[start:] + self.binds[:start]
+            if self.strategy == 'least_connections':
+                # ties go to the next one in turn
+                bind = min(binds, key=self._in_flight.get)
+            else:
+                bind = binds[0]
+            self._in_flight[bind] += 1
+        return bind, self._factories[bind]()
+
+    def release(self, bind):
+        with self._lock:
+            self._in_flight[bind] -= 1
+
+    def in_flight(self):
+        with self._lock:
+            return dict(self._in_flight)
+
+
+def _make_replica_router(app):
+    binds = app.config.get('ALCOHOL_READ_REPLICAS')
+    if not binds:
+        return None
+    # replicas are binds in SQLALCHEMY_BINDS
+    db = app.extensions['sqlalchemy'].db
+    engines = dict((bind, db.get_engine(app, bind=bind)) for bind in binds)
+    return ReplicaRouter(engines, app.config['ALCOHOL_REPLICA_STRATEGY'])
+
+
+def _reads_own_writes():
+    """
+    True while the client is inside the read your own writes window after a write.
+    """
+    value = request.cookies.get(current_app.config['ALCOHOL_PRIMARY_COOKIE'])
+    if not value:
+        return False
+    try:
+        return float(value) > time.time()
+    except ValueError:
+        return False
+
+
+def _finish_replica_routing(response, read_only):
+    """
+    Closes the replica session of a read only request, once the body is sent if it is
+    streamed, and after a successful write keeps the client's reads on the primary for
+    ALCOHOL_READ_YOUR_WRITES seconds with a cookie.
+    """
+    replicas = current_app.extensions.get('alcohol_replicas')
+    if replicas is None:
+        return
+    session = g.pop('alcohol_replica_session', None)
+    if session is not None:
+        bind = g.pop('alcohol_replica_bind')
+
+        def close():
+            session.close()
+            replicas.release(bind)
+
+        if response is not None and response.is_streamed:
+            response.call_on_close(close)
+        else:
+            close()
+    window = current_app.config['ALCOHOL_READ_YOUR_WRITES']
+    if response is not None and not read_only and window and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+            and response.status_code < 400:
+        response.set_cookie(current_app.config['ALCOHOL_PRIMARY_COOKIE'], str(time.time() + window),
+                            max_age=window, httponly=True)
+
+
+# what register found on each class, kept so that registering the class on another app
+# doesn't introspect it again, and loaded snapshots by path
+_registries = {}
+_snapshots = {}
+_file_stamps = {}
+
+
+def _get_members(cls):
+    """
+    Like inspect.getmembers, but reads the raw values from the __dict__ of each class in the
+    MRO instead of calling getattr on every name, so descriptors like Flask-SQLAlchemy's query
+    property aren't evaluated. Functions are unwrapped from classmethod and staticmethod.
+    """
+    members = {}
+    for klass in cls.__mro__:
+        for name, value in klass.__dict__.items():
+            if name in members:
+                continue
+            if isinstance(value, (classmethod, staticmethod)):
+                value = value.__func__
+            members[name] = value
+    return sorted(members.items())
+
+
+def _get_fingerprint(cls, members):
+    """
+    Identifies the version of a class a registry was built from by the files its MRO is
+    defined in and the names of its members.
+    """
+    stamps = []
+    for klass in cls.__mro__:
+        path = getattr(sys.modules.get(klass.__module__), '__file__', None)
+        if path is None:
+            continue
+        try:
+            stamp = _file_stamps[path]
+        except KeyError:
+            try:
+                stat = os.stat(path)
+                stamp = (path, stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamp = (path, None, None)
+            _file_stamps[path] = stamp
+        stamps.append(stamp)
+    return (REGISTRY_VERSION, __version__, tuple(stamps), tuple(name for name, value in members))
+
+
+def _load_snapshot(path):
+    try:
+        return _snapshots[path]
+    except KeyError:
+        pass
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        snapshot = {}
+    if not isinstance(snapshot, dict):
+        snapshot = {}
+    _snapshots[path] = snapshot
+    return snapshot
+
+
+def save_registry_snapshot(path):
+    """
+    Writes what register has found on every class registered so far in this process to a
+    file. Point ALCOHOL_REGISTRY_SNAPSHOT at it and later processes, like the workers of a
+    server that doesn't preload the app, load the models from it instead of introspecting
+    them. A class whose files or members have changed since is introspected as usual.
+    Classes with settings that can't be pickled are left out.
+    """
+    snapshot = {}
+    for key, fingerprint, registry in _registries.values():
+        try:
+            pickle.dumps(registry)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            continue
+        snapshot[key] = (fingerprint, registry)
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    _snapshots[path] = snapshot
+
+
+def _fetch_all(query, session=None):
+    if session is None:
+        return query.all()
+    return session.execute(query).unique().scalars().all()
+
+
+def _fetch_rows(query, session=None):
+    if session is None:
+        return query.all()
+    return session.execute(query).unique().all()
+
+
+def _allowed_resources(resources, allowed):
+    if allowed is True:
+        return resources
+    if not allowed:
+        return []
+    allowed = set(id(x) for x in allowed)
+    return [x for x in resources if id(x) in allowed]
+
+
+async def _resolve(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+async def _resolve_nested(value):
+    """
+    Awaits any awaitables in serialized output, which is how async getters show up.
+    """
+    if inspect.isawaitable(value):
+        return await value
+    if isinstance(value, dict):
+        for key in value:
+            value[key] = await _resolve_nested(value[key])
+    elif isinstance(value, list):
+        for idx, item in enumerate(value):
+            value[idx] = await _resolve_nested(item)
+    return value
+
+
+def _not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _bulk_item_result(obj, status):
+    return {'status': status, 'result': obj.as_dict(use_defaults=False)}
+
+
+def _is_bulk_identifier(value):
+    # json arrays and objects can't name a row, or be hashed to look one up
+    return isinstance(value, (str, int, float))
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+def default_json_encoder(obj):
+    """
+    Encodes an object to compact json bytes. Datetimes come out in ISO 8601, Decimals and UUIDs
+    as strings, and Postgres ARRAY and JSONB values are already lists and dicts.
+    """
+    return json.dumps(obj, default=_json_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def orjson_encoder(obj):
+    import orjson
+    return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _make_json_encoder(encoder):
+    """
+    ALCOHOL_JSON_ENCODER can be None for the standard library, 'orjson', an import string,
+    or a callable that takes an object and returns json as bytes or str.
+    """
+    if encoder is None:
+        return default_json_encoder
+    if encoder == 'orjson':
+        return orjson_encoder
+    if isinstance(encoder, str):
+        module_name, _, attr = encoder.rpartition('.')
+        return getattr(importlib.import_module(module_name), attr)
+    return encoder
+
+
+def _to_bytes(data):
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return data
+
+
+def api_jsonify(*args, **kwargs):
+    """
+    Works like Flask's jsonify but encodes with the app's ALCOHOL_JSON_ENCODER and builds the
+    response straight from the encoded bytes.
+    """
+    if args and kwargs:
+        raise TypeError('api_jsonify() behavior undefined when passed both args and kwargs')
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+    try:
+        encode = current_app.extensions['alcohol_json']
+    except KeyError:
+        encode = default_json_encoder
+    with timed('encode'):
+        data = _to_bytes(encode(data))
+    return Response(data, mimetype='application/json')
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """
+    Adds the time spent in the block to the current request's phase timings when metrics
+    are enabled. Custom routes can use it to time their own phases.
+    """
+    timings = getattr(g, 'alcohol_timings', None) if has_request_context() else None
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and getattr(g, 'alcohol_sql', None) is not None:
+        conn.info.setdefault('alcohol_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('alcohol_query_start')
+    if not starts or not has_request_context():
+        return
+    sql = getattr(g, 'alcohol_sql', None)
+    started = starts.pop()
+    if sql is not None:
+        sql[0] += 1
+        sql[1] += time.perf_counter() - started
+
+
+def _handle_statement_error(context):
+    # after_cursor_execute doesn't fire for a statement that raised, so its start is popped here
+    if context.connection is None or context.execution_context is None:
+        return
+    _after_cursor_execute(context.connection, context.cursor, context.statement, context.parameters,
+                          context.execution_context, False)
+
+
+def _listen_for_statements():
+    if event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_statement_error)
+
+
+class MetricsRegistry(object):
+    """
+    Collects request counts, latency histograms, SQL statement counts and times, and time
+    spent in each phase of a route, per endpoint. Streamed responses are timed until the
+    response object is returned, not until the last chunk is sent.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+    def __init__(self, server_timing=False):
+        self.server_timing = server_timing
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def start_request(self):
+        g.alcohol_timings = {}
+        g.alcohol_sql = [0, 0.0]
+        return time.perf_counter()
+
+    def finish_request(self, endpoint, response, started):
+        duration = time.perf_counter() - started
+        statements, db_time = g.alcohol_sql
+        timings = g.alcohol_timings
+        g.alcohol_timings = None
+        g.alcohol_sql = None
+        self.record(endpoint, duration, statements, db_time, timings)
+        if self.server_timing and response is not None:
+            parts = ['total;dur={0:.2f}'.format(duration * 1000),
+                     'db;dur={0:.2f};desc="{1} queries"'.format(db_time * 1000, statements)]
+            for phase in sorted(timings):
+                parts.append('{0};dur={1:.2f}'.format(phase, timings[phase] * 1000))
+            response.headers['Server-Timing'] = ', '.join(parts)
+
+    def record(self, endpoint, duration, statements, db_time, timings):
+        with self._lock:
+            try:
+                stats = self._endpoints[endpoint]
+            except KeyError:
+                stats = self._endpoints[endpoint] = {
+                    'count': 0,
+                    'duration': 0.0,
+                    'buckets': [0] * len(self.BUCKETS),
+                    'statements': 0,
+                    'db_time': 0.0,
+                    'phases': {}
+                }
+            stats['count'] += 1
+            stats['duration'] += duration
+            for idx, bound in enumerate(self.BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][idx] += 1
+            stats['statements'] += statements
+            stats['db_time'] += db_time
+            for phase, seconds in timings.items():
+                stats['phases'][phase] = stats['phases'].get(phase, 0.0) + seconds
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            endpoints = sorted((name, copy.deepcopy(stats)) for name, stats in self._endpoints.items())
+
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        lines = [
+            '# HELP alcohol_requests_total Requests handled per endpoint.',
+            '# TYPE alcohol_requests_total counter'
+        ]
+        for name, stats in endpoints:
+            lines.append('alcohol_requests_total{{endpoint="{0}"}} {1}'.format(label(name), stats['count']))
+
+        lines.append('# HELP alcohol_request_duration_seconds Time spent handling requests.')
+        lines.append('# TYPE alcohol_request_duration_seconds histogram')
+        for name, stats in endpoints:
+            for bound, count in zip(self.BUCKETS, stats['buckets']):
+                lines.append('alcohol_request_duration_seconds_bucket{{endpoint="{0}",le="{1}"}} {2}'.format(
+                    label(name), bound, count))
+            lines.append('alcohol_request_duration_seconds_bucket{{endpoint="{0}",le="+Inf"}} {1}'.format(
+                label(name), stats['count']))
+            lines.append('alcohol_request_duration_seconds_sum{{endpoint="{0}"}} {1}'.format(
+                label(name), stats['duration']))
+            lines.append('alcohol_request_duration_seconds_count{{endpoint="{0}"}} {1}'.format(
+                label(name), stats['count']))
+
+        lines.append('# HELP alcohol_sql_statements_total SQL statements executed per endpoint.')
+        lines.append('# TYPE alcohol_sql_statements_total counter')
+        for name, stats in endpoints:
+            lines.append('alcohol_sql_statements_total{{endpoint="{0}"}} {1}'.format(
+                label(name), stats['statements']))
+
+        lines.append('# HELP alcohol_sql_duration_seconds_total Time spent executing SQL per endpoint.')
+        lines.append('# TYPE alcohol_sql_duration_seconds_total counter')
+        for name, stats in endpoints:
+            lines.append('alcohol_sql_duration_seconds_total{{endpoint="{0}"}} {1}'.format(
+                label(name), stats['db_time']))
+
+        lines.append('# HELP alcohol_phase_duration_seconds_total Time spent in each phase of a route.')
+        lines.append('# TYPE alcohol_phase_duration_seconds_total counter')
+        for name, stats in endpoints:
+            for phase in sorted(stats['phases']):
+                lines.append('alcohol_phase_duration_seconds_total{{endpoint="{0}",phase="{1}"}} {2}'.format(
+                    label(name), label(phase), stats['phases'][phase]))
+
+        return '\n'.join(lines) + '\n'
+
+
 def api_messages():
     messages = get_flashed_messages()
     default_message = current_app.config.get('API_ERROR_MESSAGE')
@@ -136,6 +1079,128 @@ def api_messages():
     return messages
 
 
+class Pipeline(object):
+    """
+    The hooks of one route resolved to callables, in the order they run. APIMixin.register
+    builds one for every route name used by a hook or a route, and cls._get_pipeline(name)
+    returns it, so custom routes can run the same stages as the auto routes. Each stage is
+    timed under its own name when metrics are enabled, and skipped when it has no hooks.
+    """
+    __slots__ = ('route', 'authorizers', 'row_filters', 'batch_authorizers', 'adjusters', 'before_returns')
+
+    def __init__(self, route, authorizers=(), row_filters=(), batch_authorizers=(), adjusters=(),
+                 before_returns=()):
+        self.route = route
+        self.authorizers = tuple(authorizers)
+        self.row_filters = tuple(row_filters)
+        self.batch_authorizers = tuple(batch_authorizers)
+        self.adjusters = tuple(adjusters)
+        self.before_returns = tuple(before_returns)
+
+    def __repr__(self):
+        return '<Pipeline {0} {1}>'.format(self.route, self.describe())
+
+    def describe(self):
+        """
+        Returns the names of the hooks in each stage, in the order they run.
+        """
+        return {
+            'authorize': [x.__name__ for x in self.authorizers],
+            'authorize_rows': [x.__name__ for x in self.row_filters],
+            'adjust_query': [x.__name__ for x in self.adjusters],
+            'authorize_batch': [x.__name__ for x in self.batch_authorizers],
+            'before_return': [x.__name__ for x in self.before_returns]
+        }
+
+    def authorize(self, resource=None):
+        if not self.authorizers:
+            return True
+        with timed('authorize'):
+            for check in self.authorizers:
+                if not check(resource):
+                    return False
+        return True
+
+    def row_criteria(self):
+        """
+        Returns the criteria of the row filters, for statements that aren't queries.
+        """
+        if not self.row_filters:
+            return []
+        with timed('authorize'):
+            criteria = [row_filter() for row_filter in self.row_filters]
+        return [x for x in criteria if x is not None]
+
+    def adjust_query(self, query):
+        for criterion in self.row_criteria():
+            query = query.filter(criterion)
+        if not self.adjusters:
+            return query
+        with timed('adjust_query'):
+            for adjuster in self.adjusters:
+                query = adjuster(query)
+        return query
+
+    def authorize_batch(self, resources):
+        """
+        Returns the resources that every batch authorizer allows, in their original order.
+        """
+        if not self.batch_authorizers:
+            return resources
+        with timed('authorize'):
+            for check in self.batch_authorizers:
+                resources = _allowed_resources(resources, check(resources))
+        return resources
+
+    def before_return(self, resource=None):
+        """
+        Runs the before_return hooks and returns False if any of them failed validation.
+        """
+        if self.before_returns:
+            with timed('before_return'):
+                for before in self.before_returns:
+                    before(resource)
+        return not getattr(g, 'failed_validation', False)
+
+    async def authorize_async(self, resource=None):
+        if not self.authorizers:
+            return True
+        with timed('authorize'):
+            for check in self.authorizers:
+                if not await _resolve(check(resource)):
+                    return False
+        return True
+
+    async def adjust_query_async(self, query):
+        if self.row_filters:
+            with timed('authorize'):
+                for row_filter in self.row_filters:
+                    criterion = await _resolve(row_filter())
+                    if criterion is not None:
+                        query = query.filter(criterion)
+        if not self.adjusters:
+            return query
+        with timed('adjust_query'):
+            for adjuster in self.adjusters:
+                query = await _resolve(adjuster(query))
+        return query
+
+    async def authorize_batch_async(self, resources):
+        if not self.batch_authorizers:
+            return resources
+        with timed('authorize'):
+            for check in self.batch_authorizers:
+                resources = _allowed_resources(resources, await _resolve(check(resources)))
+        return resources
+
+    async def before_return_async(self, resource=None):
+        if self.before_returns:
+            with timed('before_return'):
+                for before in self.before_returns:
+                    await _resolve(before(resource))
+        return not getattr(g, 'failed_validation', False)
+
+
 class Router(object):
     """
     Base object that provides the registration methods for the APIMixin and APIMeta classes.
@@ -166,20 +1231,32 @@ class Router(object):
             raise TypeError("cls must be a subclass of Router or APIMixin, not one of the base classes themselves")
 
         app.config.setdefault('ROUTE_PREFIX', None)
+        app.config.setdefault('ALCOHOL_JSON_ENCODER', None)
+        if 'alcohol_json' not in app.extensions:
+            app.extensions['alcohol_json'] = _make_json_encoder(app.config['ALCOHOL_JSON_ENCODER'])
+        app.config.setdefault('ALCOHOL_METRICS', False)
+        app.config.setdefault('ALCOHOL_SERVER_TIMING', False)
+        if 'alcohol_metrics' not in app.extensions:
+            metrics = None
+            if app.config['ALCOHOL_METRICS'] or app.config['ALCOHOL_SERVER_TIMING']:
+                metrics = MetricsRegistry(server_timing=app.config['ALCOHOL_SERVER_TIMING'])
+                _listen_for_statements()
+            app.extensions['alcohol_metrics'] = metrics
 
         if not subdomain:
             if hasattr(app, "subdomain") and app.subdomain is not None:
                 subdomain = app.subdomain
 
-        # go through all the members of the class and add rules for those with a @route decorator
+        # add rules for the members of the class with a @route decorator
         with app.app_context():
-            for name, value in inspect.getmembers(cls):
-                if hasattr(value, '_rule_cache') and name in value._rule_cache \
-                        and (not value._rule_cache['is_auto'] or name in cls.__autoroutes__):
+            registry = cls._get_registry(app)
+            for name, is_auto, cached_rules in registry['routes']:
+                if not is_auto or name in cls.__autoroutes__:
 
-                    proxy = cls.make_proxy_method(name)
+                    read_only = any(options.get('read_only') for rule, options in cached_rules)
+                    proxy = cls.make_proxy_method(name, read_only)
                     route_name = cls.build_route_name(name)
-                    for idx, cached_rule in enumerate(value._rule_cache[name]):
+                    for idx, cached_rule in enumerate(cached_rules):
                         rule, options = cached_rule
                         rule = cls.build_rule(rule, app.config['ROUTE_PREFIX'])
                         sub, ep, options = cls.parse_options(options)
@@ -189,13 +1266,51 @@ class Router(object):
 
                         if ep:
                             endpoint = ep
-                        elif len(value._rule_cache[name]) == 1:
+                        elif len(cached_rules) == 1:
                             endpoint = route_name
                         else:
                             endpoint = "%s_%d" % (route_name, idx,)
 
                         app.add_url_rule(rule, endpoint, proxy, subdomain=subdomain, **options)
 
+    @classmethod
+    def _get_registry(cls, app):
+        """
+        Returns what the class's members tell register, introspecting the class once per
+        process. With ALCOHOL_REGISTRY_SNAPSHOT set, a matching entry from that snapshot is
+        used instead, see save_registry_snapshot.
+        """
+        try:
+            return _registries[cls][2]
+        except KeyError:
+            pass
+        members = _get_members(cls)
+        key = '{0}.{1}'.format(cls.__module__, cls.__qualname__)
+        fingerprint = _get_fingerprint(cls, members)
+        registry = None
+        snapshot_path = app.config.get('ALCOHOL_REGISTRY_SNAPSHOT')
+        if snapshot_path:
+            entry = _load_snapshot(snapshot_path).get(key)
+            if entry is not None and entry[0] == fingerprint:
+                registry = entry[1]
+        if registry is None:
+            registry = cls._introspect(members)
+        _registries[cls] = (key, fingerprint, registry)
+        return registry
+
+    @classmethod
+    def _introspect(cls, members):
+        """
+        Goes through the members of the class once and returns a dict of plain data describing
+        them. Subclasses add to it.
+        """
+        routes = []
+        for name, value in members:
+            rule_cache = getattr(value, '__dict__', {}).get('_rule_cache')
+            if rule_cache and name in rule_cache:
+                routes.append((name, rule_cache['is_auto'], rule_cache[name]))
+        return {'routes': routes}
+
     @classmethod
     def parse_options(cls, options):
         """
@@ -205,25 +1320,59 @@ class Router(object):
         options = options.copy()
         subdomain = options.pop('subdomain', None)
         endpoint = options.pop('endpoint', None)
+        options.pop('read_only', None)
         return subdomain, endpoint, options,
 
     @classmethod
-    def make_proxy_method(cls, name):
+    def make_proxy_method(cls, name, read_only=False):
         """
         Creates a proxy function that can be used by Flasks routing. The
         proxy instantiates the FlaskView subclass and calls the appropriate
         method.
 
         :param name: the name of the method to create a proxy for
+
+        :param read_only: whether the method only reads, so its queries can
+                          go to a replica
         """
 
         i = cls()
         view = getattr(i, name)
+        if getattr(cls, '__async__', False) and hasattr(i, name + '_async'):
+            view = getattr(i, name + '_async')
+        is_async = inspect.iscoroutinefunction(view)
 
         if cls.__decorators__:
             for decorator in cls.__decorators__:
                 view = decorator(view)
 
+        if is_async:
+            @functools.wraps(view)
+            async def async_proxy(**forgettable_view_args):
+                del forgettable_view_args
+
+                metrics = current_app.extensions.get('alcohol_metrics')
+                if metrics is not None:
+                    started = metrics.start_request()
+
+                response = None
+                try:
+                    try:
+                        response = await view(**request.view_args)
+                    finally:
+                        async_session = g.pop('alcohol_async_session', None)
+                        if async_session is not None:
+                            await async_session.close()
+                    if not isinstance(response, Response):
+                        response = make_response(response)
+                finally:
+                    if metrics is not None:
+                        metrics.finish_request(request.endpoint, response, started)
+
+                return response
+
+            return async_proxy
+
         @functools.wraps(view)
         def proxy(**forgettable_view_args):
             # Always use the global request object's view_args, because they
@@ -231,9 +1380,21 @@ class Router(object):
             # wrapper gets called. This matches Flask's behavior.
             del forgettable_view_args
 
-            response = view(**request.view_args)
-            if not isinstance(response, Response):
-                response = make_response(response)
+            metrics = current_app.extensions.get('alcohol_metrics')
+            if metrics is not None:
+                started = metrics.start_request()
+
+            g.alcohol_read_only = read_only
+            response = None
+            try:
+                response = view(**request.view_args)
+                if not isinstance(response, Response):
+                    response = make_response(response)
+            finally:
+                # a route can find out it only read, like a batch of GETs
+                _finish_replica_routing(response, g.get('alcohol_read_only', read_only))
+                if metrics is not None:
+                    metrics.finish_request(request.endpoint, response, started)
 
             return response
 
@@ -313,6 +1474,7 @@ class APIMixin(Router):
         'public': False, # unlike columns, relationships are private by default
         'defer': True, # strongly suggest you keep this as true for relationships to avoid huge chains
         'set_by': None, # relationships don't yet support setting from another table's api
+        'load': None, # joined, selectin, subquery, or select, defaults to selectin for collections, else joined
         'example': None,
         'input_type': None,
         'label': None
@@ -320,6 +1482,20 @@ class APIMixin(Router):
     __idattr__ = 'id'
     __maxresults__ = None
     __sort__ = None
+    __pagination__ = None # 'offset' or 'keyset', a request can also ask for keyset with ?after=<cursor>
+    __count__ = None # None for a separate COUNT query, or 'exact', 'estimated', or 'none', can be set with ?count=
+    __stream__ = False # stream unpaginated index responses, can be set with ?stream=
+    __streambatch__ = 1000 # rows fetched from the cursor and serialized at a time when streaming
+    __etags__ = True # send ETags from get and index and answer If-None-Match with 304
+    __versionattr__ = None # a version or updated at column, lets get and index build ETags without serializing
+    __async__ = False # use the async auto routes with the ALCOHOL_ASYNC_SESSION factory, needs Flask 2
+    __cache__ = True # set to False to keep this model's read routes out of the response cache
+    __requiredfields__ = [] # fields that are always loaded, e.g. columns that more_json or before_return hooks read
+    __uniquecheck__ = 'select' # or 'constraint' to make _is_unique trust the database, a violation answers 409
+    __fastwrites__ = True # let put and delete change the row without loading it first when no hook needs the object
+    # fetch server generated values with the INSERT/UPDATE (RETURNING where supported) so writes can
+    # serialize without a SELECT, changes every flush of the model
+    __eagerdefaults__ = False
 
     @classmethod
     def register(cls, app, subdomain=None):
@@ -343,108 +1519,467 @@ class APIMixin(Router):
         super(APIMixin, cls).register(app, subdomain)
 
         app.config.setdefault('API_ERROR_MESSAGE', None)
-
-        cls.__security__ = {}
-        cls.__beforereturns__ = {}
-        cls.__adjusters__ = {}
-        cls.__setters__ = {}
-        cls.__getters__ = {}
-        cls.__infos__ = {}
-        cls.__metas__ = {}
-        cls.__defaultfields__ = set([])
-        cls.__indexedfields__ = set([])
-        cls.__lazyrelationships__ = set([])
-
-        # go through all the members of the class and add filters for columns with default filters,
-        # setters for all those with a @setter decorator,
-        # and getters for all those with a @getter decorator
+        app.config.setdefault('ALCOHOL_CACHE', None)
+        app.config.setdefault('ALCOHOL_CACHE_SIZE', 1000)
+        app.config.setdefault('ALCOHOL_CACHE_TIMEOUT', 300)
+        if 'alcohol_cache' not in app.extensions:
+            app.extensions['alcohol_cache'] = _make_cache(app.config)
+            if app.extensions['alcohol_cache'] is not None:
+                _listen_for_writes()
+        app.config.setdefault('ALCOHOL_MEMO_SIZE', 10000)
+        app.config.setdefault('ALCOHOL_MEMO_TIMEOUT', 300)
+        if 'alcohol_memo' not in app.extensions:
+            # values of getters with memoize='app'
+            app.extensions['alcohol_memo'] = SimpleCache(app.config['ALCOHOL_MEMO_SIZE'],
+                                                         app.config['ALCOHOL_MEMO_TIMEOUT'])
+        app.config.setdefault('ALCOHOL_READ_REPLICAS', None)
+        app.config.setdefault('ALCOHOL_REPLICA_STRATEGY', 'round_robin')
+        app.config.setdefault('ALCOHOL_READ_YOUR_WRITES', 5)
+        app.config.setdefault('ALCOHOL_PRIMARY_COOKIE', 'alcohol_primary')
+        if 'alcohol_replicas' not in app.extensions:
+            app.extensions['alcohol_replicas'] = _make_replica_router(app)
 
         with app.app_context():
             mapper = class_mapper(cls)
-            if mapper.polymorphic_map:
-                # do something that works here
-                pass
-            for name, value in inspect.getmembers(cls):
-                if type(value) == InstrumentedAttribute and not name.startswith('_'):
-                    # the _ is to avoid doubling fields
-                    # find out whether it is a relationship or column
-                    if type(value.comparator) == ColumnProperty.Comparator:
-                        api_info = cls.__columndefaults__.copy()
-                        api_info.update(value.comparator.info)
-                        indexed = bool(value.comparator.primary_key or value.comparator.index)
-                        if indexed:
-                            cls.__indexedfields__.add(name)
-                        editable = api_info['set_by'] == 'json'
-                    else:
-                        # it is a relationship
-                        api_info = cls.__relationshipdefaults__.copy()
-                        api_info.update(value.comparator.info)
-                        if value.comparator.property.lazy == True:
-                            cls.__lazyrelationships__.add(name)
-                        indexed = False
-                        editable = False
-
-                    cls.__infos__[name] = api_info
-                    if api_info['public'] and not api_info['defer']:
-                        cls.__defaultfields__.add(name)
-                    # make the meta
-                    meta_dict = {
-                        'indexed': indexed,
-                        'editable': editable,
-                    }
-                    if editable:
-                        meta_dict['input_type'] = cls._predict_input_type(api_info, value.comparator)
-                        meta_dict['required'] = not value.comparator.nullable
-                    cls.__metas__[name] = meta_dict
+            registry = cls._get_registry(app)
+
+            cls.__security__ = registry['security']
+            cls.__rowsecurity__ = registry['rowsecurity']
+            cls.__batchsecurity__ = registry['batchsecurity']
+            cls.__beforereturns__ = registry['beforereturns']
+            cls.__adjusters__ = registry['adjusters']
+            cls.__cachekeys__ = registry['cachekeys']
+            cls.__setters__ = registry['setters']
+            cls.__getters__ = registry['getters']
+            cls.__infos__ = registry['infos']
+            cls.__metas__ = registry['metas']
+            cls.__defaultfields__ = registry['defaultfields']
+            cls.__indexedfields__ = registry['indexedfields']
+            cls.__lazyrelationships__ = registry['lazyrelationships']
+            cls.__loadstrategies__ = registry['loadstrategies']
+            cls.__loaderoptions__ = {}
+
+            cls.__pipelines__ = {}
+            route_names = set(cls.__security__) | set(cls.__rowsecurity__) | set(cls.__batchsecurity__) | \
+                set(cls.__beforereturns__) | set(cls.__adjusters__)
+            route_names.update(name for name, is_auto, cached_rules in registry['routes'])
+            for route_name in route_names:
+                cls.__pipelines__[route_name] = cls._build_pipeline(route_name)
+
+            if cls.__eagerdefaults__:
+                # otherwise server defaults and onupdate expressions are expired by the flush
+                mapper.eager_defaults = True
+
+            cls._compile_sql_fields(mapper)
+            cls._compile_serializers(mapper)
+            cls._compile_load_columns(mapper)
+            cls._compile_field_updates(mapper)
+            cls._compile_fast_routes(mapper)
 
-                elif hasattr(value, '_extra_cache'):
-                    info = value.__dict__['_extra_cache']
+    @classmethod
+    def _introspect(cls, members):
+        """
+        Adds the fields and hooks of the model to the Router registry in the same pass:
+        api info and meta for columns and relationships, and the functions decorated with
+        @extra_field, @authorizes, @authorizes_rows, @authorizes_batch, @before_return,
+        @adjusts_query, @cache_key, @setter and @getter.
+        """
+        registry = super(APIMixin, cls)._introspect(members)
+        security = {}
+        rowsecurity = {}
+        batchsecurity = {}
+        beforereturns = {}
+        adjusters = {}
+        cachekeys = {}
+        setters = {}
+        getters = {}
+        infos = {}
+        metas = {}
+        defaultfields = set([])
+        indexedfields = set([])
+        lazyrelationships = set([])
+        loadstrategies = {}
+
+        mapper = class_mapper(cls)
+        if mapper.polymorphic_map:
+            # do something that works here
+            pass
+        for name, value in members:
+            if type(value) == InstrumentedAttribute and not name.startswith('_'):
+                # the _ is to avoid doubling fields
+                # find out whether it is a relationship or column
+                if type(value.comparator) == ColumnProperty.Comparator:
                     api_info = cls.__columndefaults__.copy()
-                    api_info['indexed'] = False
-                    api_info.update(info)
-                    if api_info['public']:
-                        cls.__getters__[name] = name
-                        cls.__infos__[name] = api_info
-                        if not api_info['defer']:
-                            cls.__defaultfields__.add(name)
-                        cls.__metas__[name] = {
-                            'indexed': False,
-                            'editable': False
-                        }
-
-                elif hasattr(value, '_check_cache'):
-                    route_names = value.__dict__['_check_cache']
-                    for route_name in route_names:
-                        try:
-                            cls.__security__[route_name].append(name)
-                        except KeyError:
-                            cls.__security__[route_name] = [name]
-
-                elif hasattr(value, '_before_cache'):
-                    route_names = value.__dict__['_before_cache']
-                    for route_name in route_names:
-                        try:
-                            cls.__beforereturns__[route_name].append(name)
-                        except KeyError:
-                            cls.__beforereturns__[route_name] = [name]
-
-                elif hasattr(value, '_adjuster_cache'):
-                    route_names = value.__dict__['_adjuster_cache']
-                    for route_name in route_names:
-                        try:
-                            cls.__adjusters__[route_name].append(name)
-                        except KeyError:
-                            cls.__adjusters__[route_name] = [name]
-
-                elif hasattr(value, '_setter_cache'):
-                    field_names = value.__dict__['_setter_cache']
-                    for field_name in field_names:
-                        cls.__setters__[field_name] = name
-
-                elif hasattr(value, '_getter_cache'):
-                    field_names = value.__dict__['_getter_cache']
-                    for field_name in field_names:
-                        cls.__getters__[field_name] = name
+                    api_info.update(value.comparator.info)
+                    indexed = bool(value.comparator.primary_key or value.comparator.index)
+                    if indexed:
+                        indexedfields.add(name)
+                    editable = api_info['set_by'] == 'json'
+                else:
+                    # it is a relationship
+                    api_info = cls.__relationshipdefaults__.copy()
+                    api_info.update(value.comparator.info)
+                    strategy = cls._predict_load_strategy(api_info, value.comparator.property)
+                    if strategy:
+                        loadstrategies[name] = strategy
+                    lazyrelationships.add(name)
+                    indexed = False
+                    editable = False
+
+                infos[name] = api_info
+                if api_info['public'] and not api_info['defer']:
+                    defaultfields.add(name)
+                # make the meta
+                meta_dict = {
+                    'indexed': indexed,
+                    'editable': editable,
+                }
+                if editable:
+                    meta_dict['input_type'] = cls._predict_input_type(api_info, value.comparator)
+                    meta_dict['required'] = not value.comparator.nullable
+                metas[name] = meta_dict
+                continue
+
+            value_dict = getattr(value, '__dict__', None)
+            if not value_dict:
+                continue
+
+            if '_extra_cache' in value_dict:
+                api_info = cls.__columndefaults__.copy()
+                api_info['indexed'] = False
+                api_info.update(value_dict['_extra_cache'])
+                if api_info['public']:
+                    getters[name] = name
+                    infos[name] = api_info
+                    if not api_info['defer']:
+                        defaultfields.add(name)
+                    metas[name] = {
+                        'indexed': False,
+                        'editable': False
+                    }
+
+            elif '_check_cache' in value_dict:
+                for route_name in value_dict['_check_cache']:
+                    security.setdefault(route_name, []).append(name)
+
+            elif '_rows_cache' in value_dict:
+                for route_name in value_dict['_rows_cache']:
+                    rowsecurity.setdefault(route_name, []).append(name)
+
+            elif '_batch_cache' in value_dict:
+                for route_name in value_dict['_batch_cache']:
+                    batchsecurity.setdefault(route_name, []).append(name)
+
+            elif '_before_cache' in value_dict:
+                for route_name in value_dict['_before_cache']:
+                    beforereturns.setdefault(route_name, []).append(name)
+
+            elif '_adjuster_cache' in value_dict:
+                for route_name in value_dict['_adjuster_cache']:
+                    adjusters.setdefault(route_name, []).append(name)
+
+            elif '_cachekey_cache' in value_dict:
+                for route_name in value_dict['_cachekey_cache']:
+                    cachekeys.setdefault(route_name, []).append(name)
+
+            elif '_setter_cache' in value_dict:
+                for field_name in value_dict['_setter_cache']:
+                    setters[field_name] = name
+
+            elif '_getter_cache' in value_dict:
+                for field_name in value_dict['_getter_cache']:
+                    getters[field_name] = name
+
+        registry.update({
+            'security': security,
+            'rowsecurity': rowsecurity,
+            'batchsecurity': batchsecurity,
+            'beforereturns': beforereturns,
+            'adjusters': adjusters,
+            'cachekeys': cachekeys,
+            'setters': setters,
+            'getters': getters,
+            'infos': infos,
+            'metas': metas,
+            'defaultfields': defaultfields,
+            'indexedfields': indexedfields,
+            'lazyrelationships': lazyrelationships,
+            'loadstrategies': loadstrategies
+        })
+        return registry
+
+    @classmethod
+    def _compile_sql_fields(cls, mapper):
+        """
+        Maps each extra field that has a SQL expression to a column property on the model.
+        Fields that aren't included by default get a deferred property, so the expression is
+        only selected when a request includes the field.
+        """
+        cls.__sqlfields__ = {}
+        for name, getter_name in cls.__getters__.items():
+            expression = getattr(getattr(cls, getter_name), '_expression_cache', None)
+            if expression is None:
+                continue
+            key = '_sql_' + name
+            if key not in mapper.attrs:
+                if not isinstance(expression, ClauseElement):
+                    expression = expression(cls)
+                deferred = name not in cls.__defaultfields__
+                mapper.add_property(key, column_property(expression, deferred=deferred))
+            cls.__sqlfields__[name] = key
+
+    @classmethod
+    def _compile_serializers(cls, mapper):
+        """
+        Builds one accessor per field so that as_dict can serialize a row without looking up
+        getters, guessing their signatures, or checking the type of every value.
+        """
+        cls.__serializers__ = {}
+        cls.__plans__ = {}
+        for name in set(cls.__infos__) | set(cls.__getters__):
+            if name in cls.__sqlfields__:
+                func = getattr(cls, cls.__getters__[name])
+                accessor = _make_sql_field_accessor(cls.__sqlfields__[name], _make_getter_accessor(func, name))
+            elif name in cls.__getters__:
+                func = getattr(cls, cls.__getters__[name])
+                accessor = _make_getter_accessor(func, name)
+                memoize = getattr(func, '_memoize_cache', None)
+                if memoize:
+                    if inspect.iscoroutinefunction(func):
+                        raise ValueError('{0}.{1} is async and can\'t be memoized'.format(cls.__name__, name))
+                    accessor = _memoize(accessor, cls, name, **memoize)
+            elif name in mapper.relationships:
+                prop = mapper.relationships[name]
+                if issubclass(prop.mapper.class_, APIMixin):
+                    accessor = _make_relationship_accessor(name, prop.uselist)
+                else:
+                    accessor = lambda obj, name=name: obj._auto_get(name)
+            else:
+                accessor = operator.attrgetter(name)
+            cls.__serializers__[name] = accessor
+        cls.__defaultplan__ = cls._get_serializer_plan(cls.__defaultfields__)
+
+    @classmethod
+    def _compile_load_columns(cls, mapper):
+        """
+        Works out which mapped columns each field needs so that index and get can load only
+        the columns of the included fields.
+        """
+        def column_keys(name):
+            try:
+                prop = getattr(cls, name).property
+            except AttributeError:
+                return ()
+            if isinstance(prop, ColumnProperty):
+                return (prop.key,)
+            try:
+                # many to one relationships need their foreign keys to lazy load
+                return tuple(mapper.get_property_by_column(col).key for col in prop.local_columns)
+            except AttributeError:
+                return ()
+
+        cls.__loadcolumns__ = {}
+        for name in set(cls.__infos__) | set(cls.__getters__):
+            if name in cls.__sqlfields__:
+                # the database computes it, so none of the columns it reads have to be loaded
+                cls.__loadcolumns__[name] = set([cls.__sqlfields__[name]])
+                continue
+            keys = set(column_keys(name))
+            if name in cls.__getters__:
+                func = getattr(cls, cls.__getters__[name])
+                for required in getattr(func, '_requires_cache', ()):
+                    keys.update(column_keys(required))
+            cls.__loadcolumns__[name] = keys
+
+        required_keys = set(mapper.get_property_by_column(col).key for col in mapper.primary_key)
+        for name in [cls.__idattr__, cls.__versionattr__] + list(cls.__requiredfields__):
+            if name is None:
+                continue
+            required_keys.update(column_keys(name))
+        cls.__requiredcolumns__ = required_keys
+        # deferred columns, including SQL backed extra fields, aren't loaded unless asked for
+        cls.__allcolumns__ = set(prop.key for prop in mapper.column_attrs if not prop.deferred)
+
+    @classmethod
+    def _get_column_options(cls, fields, loader=None):
+        """
+        Returns the options that restrict the columns selected for the model to the ones the
+        fields need. Pass the loader of a relationship to restrict the related model instead.
+        """
+        keys = set(cls.__requiredcolumns__)
+        for field in fields:
+            keys.update(cls.__loadcolumns__.get(field, ()))
+        attrs = class_mapper(cls).column_attrs
+        if keys >= cls.__allcolumns__:
+            deferred_keys = sorted(keys - cls.__allcolumns__)
+            if loader is None:
+                return [undefer(attrs[key].class_attribute) for key in deferred_keys]
+            return [loader.undefer(attrs[key].class_attribute) for key in deferred_keys]
+        columns = [attrs[key].class_attribute for key in sorted(keys)]
+        if loader is None:
+            return [load_only(*columns)]
+        return [loader.load_only(*columns)]
+
+    @classmethod
+    def _compile_field_updates(cls, mapper):
+        """
+        Lists the columns writes can set as (name, set_by, depends_on) in the order they are
+        set, so _get_field_updates doesn't walk the mapper on every write. Server set columns
+        without a setter are left out since nothing would set them. A column with no api info
+        under its name or attribute, like a private column behind a hybrid_property of the
+        column's name, uses the column defaults updated with its own info.
+        """
+        updates = []
+        for col in mapper.columns:
+            if not isinstance(col, Column):
+                # SQL backed extra fields are read only
+                continue
+            # this order is the listed order except that hybrid properties go first
+            api_info = cls.__infos__.get(col.name) or cls.__infos__.get(mapper.get_property_by_column(col).key)
+            if api_info is None:
+                api_info = dict(cls.__columndefaults__, **col.info)
+            set_by = api_info['set_by']
+            depends_on = None
+            if set_by == 'server':
+                if col.name not in cls.__setters__:
+                    continue
+                depends_on = getattr(getattr(cls, cls.__setters__[col.name]), '_depends_cache', None)
+            elif set_by not in ('json', 'url'):
+                continue
+            updates.append((col.name, set_by, depends_on))
+        cls.__updatefields__ = tuple(updates)
+
+    @classmethod
+    def _compile_fast_routes(cls, mapper):
+        """
+        Works out whether put and delete can change the row with a single UPDATE or DELETE
+        instead of loading the object first, which is when no hook, validator, mapper event or
+        cascade needs the object.
+        """
+        cls.__fastroutes__ = set()
+        if not cls.__fastwrites__ or len(mapper.tables) != 1 or mapper.inherits is not None or \
+                mapper.polymorphic_on is not None or mapper.version_id_col is not None:
+            return
+        for route_name in ('put', 'delete'):
+            pipeline = cls._get_pipeline(route_name)
+            if pipeline.authorizers or pipeline.batch_authorizers or pipeline.adjusters or pipeline.before_returns:
+                continue
+            if route_name == 'put':
+                overridden = [x for x in ('_auto_update', '_get_field_updates', '_set_field_value', '_auto_set')
+                              if next(klass for klass in cls.__mro__ if x in klass.__dict__) is not APIMixin]
+                # a field set through something other than its column attribute, like a
+                # hybrid_property, has to run on the object
+                indirect = [x for x, set_by, depends_on in cls.__updatefields__ if x not in mapper.column_attrs]
+                if overridden or indirect or mapper.validators or \
+                        mapper.dispatch.before_update or mapper.dispatch.after_update:
+                    continue
+            else:
+                if mapper.dispatch.before_delete or mapper.dispatch.after_delete:
+                    continue
+                # the ORM would delete or unlink related rows, unless the database is left to do it
+                if any(not prop.viewonly and not prop.passive_deletes and
+                       (prop.direction.name != 'MANYTOONE' or 'delete' in prop.cascade)
+                       for prop in mapper.relationships):
+                    continue
+            cls.__fastroutes__.add(route_name)
+
+    @classmethod
+    def _get_write_statement(cls, statement, pipeline, identifier):
+        id_col = getattr(cls, cls.__idattr__)
+        return statement.where(and_(id_col == identifier, *pipeline.row_criteria()))
+
+    @classmethod
+    def _update_by_id(cls, pipeline, identifier):
+        """
+        The fast path of put: one UPDATE ... RETURNING whose row becomes the object that is
+        serialized. Returns None when the request has to take the normal path, because the
+        database has no RETURNING or a field has a setter.
+        """
+        mapper = class_mapper(cls)
+        session = cls._get_sql_session()
+        if not session.connection(mapper=mapper).dialect.full_returning:
+            return None
+        values = {}
+        for name, value, try_auto in cls._get_field_updates():
+            if name in cls.__setters__:
+                return None
+            values[name] = value
+        if not values:
+            return None
+        table = mapper.local_table
+        statement = cls._get_write_statement(update(table), pipeline, identifier)
+        statement = statement.values(values).returning(*table.columns)
+        query = select(cls).from_statement(statement).execution_options(populate_existing=True)
+        try:
+            obj = session.execute(query).scalars().first()
+        except IntegrityError:
+            session.rollback()
+            return api_jsonify(messages=api_messages()), 409
+        if obj is None:
+            return api_jsonify(messages=api_messages()), 404
+        session.info.setdefault('alcohol_written_tables', set()).add(table.name)
+        with timed('serialize'):
+            result = obj.as_dict(use_defaults=False)
+        session.commit()
+        return api_jsonify(result)
+
+    @classmethod
+    def _delete_by_id(cls, pipeline, identifier):
+        """
+        The fast path of delete: one DELETE, with a 404 when it didn't match a row.
+        """
+        mapper = class_mapper(cls)
+        session = cls._get_sql_session()
+        table = mapper.local_table
+        statement = cls._get_write_statement(delete(table), pipeline, identifier)
+        result = session.execute(statement, bind_arguments={'mapper': mapper})
+        if not result.rowcount:
+            return api_jsonify(messages=api_messages()), 404
+        session.info.setdefault('alcohol_written_tables', set()).add(table.name)
+        session.commit()
+        return api_jsonify(), 204
+
+    @classmethod
+    def _load_only_query(cls, query, extra_fields=()):
+        """
+        Restricts the columns selected for the model to the ones the included fields need.
+        """
+        options = cls._get_column_options(itertools.chain(cls._get_included_fields(), extra_fields))
+        if options:
+            return query.options(*options)
+        return query
+
+    @classmethod
+    def _get_serializer_plan(cls, fields, nested=()):
+        """
+        Returns an ordered tuple of (name, accessor) pairs for a set of included fields.
+        Relationships in nested, from _get_nested_fields, are serialized with their own plan.
+        """
+        key = (frozenset(fields), nested) if nested else frozenset(fields)
+        try:
+            return cls.__plans__[key]
+        except KeyError:
+            pass
+        nested = dict(nested)
+        plan = []
+        for name in sorted(frozenset(fields)):
+            if name not in cls.__serializers__:
+                continue
+            accessor = cls.__serializers__[name]
+            if name in nested:
+                prop = class_mapper(cls).relationships[name]
+                spec = nested[name]
+                nested_plan = prop.mapper.class_._get_serializer_plan(spec.fields, spec.nested)
+                accessor = _make_nested_accessor(name, prop.uselist, nested_plan, spec.extras)
+            plan.append((name, accessor))
+        plan = tuple(plan)
+        if len(cls.__plans__) < MAX_CACHED_PLANS:
+            cls.__plans__[key] = plan
+        return plan
+
+    @classmethod
+    def _get_request_plan(cls):
+        return cls._get_serializer_plan(cls._get_included_fields(), cls._get_nested_fields())
 
     @classmethod
     def _predict_input_type(cls, api_info, comparator):
@@ -466,28 +2001,92 @@ class APIMixin(Router):
         if column_str == 'BOOLEAN':
             return 'checkbox'
 
+    @classmethod
+    def _predict_load_strategy(cls, api_info, prop):
+        """
+        Picks the eager loader used when a relationship is included. Relationships that the
+        mapper already loads eagerly, or that can't be eager loaded, are left alone.
+        """
+        strategy = api_info.get('load')
+        if strategy:
+            if strategy not in LOADERS and strategy != 'select':
+                raise ValueError('Unknown load strategy {0} for {1}'.format(strategy, prop))
+            return strategy if strategy != 'select' else None
+        if prop.lazy in (True, 'select'):
+            # joining a collection multiplies the rows of the parent
+            return 'selectin' if prop.uselist else 'joined'
+        return None
+
     @classmethod
     def _get_included_fields(cls):
         try:
             fields = g.cached_included_fields[cls.__name__]
         except KeyError:
-            only_fields = request.args.get('only')
+            # author.first_name includes author, see _get_nested_fields for the rest of the path
+            only_fields = _parse_field_paths(request.args.get('only'))
             if only_fields:
-                fields = set([x for x in only_fields.split(',') if x in cls.__infos__])
+                fields = set([x for x in only_fields if x in cls.__infos__])
             else:
                 fields = cls.__defaultfields__
-                include_fields = request.args.get('include')
+                include_fields = _parse_field_paths(request.args.get('include'))
                 if include_fields:
-                    include_fields = set([x for x in include_fields.split(',') if x in cls.__infos__])
+                    include_fields = set([x for x in include_fields if x in cls.__infos__])
                     fields = fields | include_fields
 
-                defer_fields = request.args.get('defer')
+                defer_fields = _parse_field_paths(request.args.get('defer'))
                 if defer_fields:
-                    defer_fields = set(defer_fields.split(','))
+                    defer_fields = set([x for x in defer_fields if not defer_fields[x]])
                     fields = fields - defer_fields
             g.cached_included_fields[cls.__name__] = fields
         return fields
 
+    @classmethod
+    def _get_nested_fields(cls):
+        """
+        Returns (relationship, FieldSpec) pairs for the relationships that dotted paths in only,
+        include or defer narrow. include=author.first_name serializes and loads only the first
+        name of the author, defer=author.email serializes the defaults of the author but email.
+        """
+        try:
+            nested = g.cached_nested_fields[cls.__name__]
+        except KeyError:
+            selected = _parse_field_paths(request.args.get('only'))
+            deferred = {}
+            if not selected:
+                selected = _parse_field_paths(request.args.get('include'))
+                deferred = _parse_field_paths(request.args.get('defer'))
+            nested = cls._get_nested_specs(selected, deferred)
+            g.cached_nested_fields[cls.__name__] = nested
+        return nested
+
+    @classmethod
+    def _get_nested_specs(cls, selected, deferred):
+        mapper = class_mapper(cls)
+        nested = []
+        for name in sorted(set(selected) | set(deferred)):
+            if name not in cls.__lazyrelationships__ or not (selected.get(name) or deferred.get(name)):
+                continue
+            target = mapper.relationships[name].mapper.class_
+            if hasattr(target, '__infos__'):
+                nested.append((name, target._get_field_spec(selected.get(name, {}), deferred.get(name, {}))))
+        return tuple(nested)
+
+    @classmethod
+    def _get_field_spec(cls, selected, deferred):
+        """
+        Works out the FieldSpec of a related model from the part of the dotted paths below it.
+        Names that aren't fields of the model are taken to be more_json keys.
+        """
+        if selected:
+            names = set(selected)
+        else:
+            names = set(cls.__defaultfields__)
+        names -= set([x for x in deferred if not deferred[x]])
+        fields = frozenset([x for x in names if x in cls.__infos__ and cls.__infos__[x]['public']])
+        # without a selection more_json is left whole
+        extras = frozenset(names - set(cls.__infos__)) if selected else None
+        return FieldSpec(fields, extras, cls._get_nested_specs(selected, deferred))
+
     @classmethod
     def _get_included_relationships(cls):
         included_fields = cls._get_included_fields()
@@ -498,13 +2097,96 @@ class APIMixin(Router):
         return included_relationships
 
     @classmethod
-    def _joinedload_query(cls, query):
-        jloads = []
-        for rel in cls._get_included_relationships():
-            jload = joinedload(rel)
-            jloads.append(jload)
-        if jloads:
-            return query.options(*jloads)
+    def _get_loader_options(cls, relationships, parent=None, visited=frozenset(), nested=(), stream=False):
+        """
+        Builds loader options for the relationships along with the default relationships of
+        the related models, which as_dict(use_defaults=True) will serialize, so nested
+        serialization doesn't lazy load once per row. Relationships in nested, from
+        _get_nested_fields, only select the columns and relationships their fields need.
+        A streamed query uses yield_per, which can't run the loaders that need the whole result,
+        so those are swapped for selectin loads and everything else the related models would
+        eager load is left to load lazily.
+        """
+        options = []
+        mapper = class_mapper(cls)
+        nested = dict(nested)
+        for rel in relationships:
+            prop = mapper.relationships[rel]
+            if prop in visited:
+                continue
+            attr = getattr(cls, rel)
+            strategy = cls.__loadstrategies__.get(rel)
+            if stream:
+                lazy = strategy or prop.lazy
+                if lazy == 'subquery' or (lazy in ('joined', False) and prop.uselist):
+                    strategy = 'selectin'
+            if parent is None:
+                loader = LOADERS[strategy](attr) if strategy else defaultload(attr)
+            else:
+                loader = getattr(parent, (strategy or 'default') + 'load')(attr)
+            options.append(loader)
+            if stream:
+                options.append(loader.lazyload('*'))
+            target = prop.mapper.class_
+            if rel in nested:
+                spec = nested[rel]
+                options.extend(target._get_column_options(spec.fields, loader))
+                related = [x for x in target.__lazyrelationships__ if x in spec.fields]
+                options.extend(target._get_loader_options(related, loader, visited | set([prop]), spec.nested,
+                                                          stream))
+                if spec.extras is not None and not spec.extras:
+                    # nothing reads the relationships left out, so don't let the mapper join them
+                    target_mapper = prop.mapper
+                    for name in target.__lazyrelationships__:
+                        if name not in spec.fields and target_mapper.relationships[name].lazy != 'select':
+                            options.append(loader.lazyload(getattr(target, name)))
+            elif hasattr(target, '__defaultfields__'):
+                related = [x for x in target.__lazyrelationships__ if x in target.__defaultfields__]
+                options.extend(target._get_loader_options(related, loader, visited | set([prop]), stream=stream))
+        return options
+
+    @classmethod
+    def _eagerload_query(cls, query, stream=False):
+        relationships = frozenset(cls._get_included_relationships())
+        if stream:
+            # the relationships that weren't asked for may still be eager loaded by the mapper,
+            # which yield_per can't do for collections, and they aren't serialized anyway
+            query = query.options(lazyload('*'))
+        elif request.args.get('only'):
+            query = cls._skip_eager_relationships(query, relationships)
+        if not relationships:
+            return query
+        nested = tuple(x for x in cls._get_nested_fields() if x[0] in relationships)
+        key = (relationships, nested, stream)
+        try:
+            options = cls.__loaderoptions__[key]
+        except KeyError:
+            options = cls._get_loader_options(sorted(relationships), nested=nested, stream=stream)
+            if len(cls.__loaderoptions__) < MAX_CACHED_PLANS:
+                cls.__loaderoptions__[key] = options
+        if options:
+            return query.options(*options)
+        return query
+
+    @classmethod
+    def _skip_eager_relationships(cls, query, relationships):
+        """
+        A sparse fieldset doesn't serialize the relationships it leaves out, so the ones the
+        mapper eager loads are loaded lazily instead, unless __requiredfields__ names them.
+        """
+        key = ('skipped', relationships)
+        try:
+            options = cls.__loaderoptions__[key]
+        except KeyError:
+            mapper = class_mapper(cls)
+            eager = ('joined', 'subquery', 'selectin', 'immediate', False)
+            options = [lazyload(getattr(cls, name)) for name in sorted(cls.__lazyrelationships__)
+                       if name not in relationships and name not in cls.__requiredfields__
+                       and mapper.relationships[name].lazy in eager]
+            if len(cls.__loaderoptions__) < MAX_CACHED_PLANS:
+                cls.__loaderoptions__[key] = options
+        if options:
+            return query.options(*options)
         return query
 
     @classmethod
@@ -514,29 +2196,181 @@ class APIMixin(Router):
     @classmethod
     def _get_obj_by_id(cls, identifier, route):
         id_col = getattr(cls, cls.__idattr__)
-        query = cls.query.filter(id_col == identifier)
-        query = cls._joinedload_query(query)
+        query = cls._get_query().filter(id_col == identifier)
+        if route == 'get':
+            # writes can touch any column, so only reads get trimmed
+            query = cls._load_only_query(query)
+        query = cls._eagerload_query(query)
         query = cls._adjust_query(query, route)
         return query.first()
 
     @classmethod
-    def _get_results(cls, route='index'):
-        query = cls.query
-        for field in cls.__indexedfields__:
-            filter_string = request.args.get(field)
-            if filter_string:
-                column = getattr(cls, field)
-                filter_list = filter_string.split(',')
-                filter_list = [x if x != 'null' else None for x in filter_list]
+    def _get_cache_tables(cls, relationships=None, visited=None):
+        """
+        Returns the tables a response depends on, this model's plus the ones of included
+        relationships and the default relationships they serialize.
+        """
+        if visited is None:
+            visited = set()
+        mapper = class_mapper(cls)
+        tables = set(table.name for table in mapper.tables)
+        if relationships is None:
+            relationships = cls._get_included_relationships()
+        for rel in relationships:
+            prop = mapper.relationships[rel]
+            if prop in visited:
+                continue
+            visited.add(prop)
+            target = prop.mapper.class_
+            if hasattr(target, '__defaultfields__'):
+                nested = [x for x in target.__lazyrelationships__ if x in target.__defaultfields__]
+                tables |= target._get_cache_tables(nested, visited)
+            else:
+                tables |= set(table.name for table in prop.mapper.tables)
+        return tables
+
+    @classmethod
+    def _get_cache_key(cls, route, view_args):
+        """
+        Builds the response cache key for a read route, or returns None if the response
+        shouldn't be cached. Writes to any of the tables the response depends on change the key.
+        Nothing is cached while the session has uncommitted writes, like in an atomic APIBatch.
+        """
+        cache = current_app.extensions.get('alcohol_cache')
+        if cache is None or not cls.__cache__ or _has_uncommitted_writes(cls._get_sql_session()):
+            return None
+        pipeline = cls._get_pipeline(route)
+        hooked = pipeline.row_filters or pipeline.batch_authorizers or pipeline.adjusters or pipeline.before_returns
+        if hooked and not cls.__cachekeys__.get(route):
+            # row rules, query adjusters and before_return hooks usually depend on the user,
+            # which only a cache key hook can tell, and a cache hit skips before_return
+            return None
+        tables = sorted(cls._get_cache_tables()) if route != 'meta' else []
+        key_parts = [
+            cls.__module__ + '.' + cls.__name__,
+            route,
+            sorted(view_args.items()),
+            sorted(request.args.items(multi=True)),
+            [_get_generation(cache, table) for table in tables],
+            [getattr(cls, x)() for x in cls.__cachekeys__.get(route) or []]
+        ]
+        raw = json.dumps(key_parts, default=str, sort_keys=True)
+        return 'alcohol:response:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _get_cached_response(cls, key):
+        if key is None:
+            return None
+        cached = current_app.extensions['alcohol_cache'].get(key)
+        if cached is None:
+            return None
+        data, mimetype, etag = cached
+        response = Response(data, mimetype=mimetype)
+        if etag:
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return response
+
+    @classmethod
+    def _get_version_by_id(cls, identifier, route):
+        """
+        Reads just the version column of one object. Returns None if the object can't be found.
+        """
+        id_col = getattr(cls, cls.__idattr__)
+        query = cls._get_query().filter(id_col == identifier)
+        query = cls._adjust_query(query, route)
+        row = query.with_entities(getattr(cls, cls.__versionattr__)).first()
+        if row is None:
+            return None
+        return [identifier, row[0]]
+
+    @classmethod
+    def _can_version_etag(cls):
+        # the version column only covers the row itself, not included relationships
+        return bool(cls.__etags__ and cls.__versionattr__ and not cls._get_included_relationships())
+
+    @classmethod
+    def _version_etag(cls, versions, page_info=None):
+        """
+        Builds an ETag from row versions plus the request arguments, since only/include/defer
+        and the like change the representation.
+        """
+        args = sorted(request.args.items(multi=True))
+        raw = json.dumps([cls.__name__, versions, page_info, args], default=str, sort_keys=True)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _finish_read_response(cls, response, etag=None, cache_key=None):
+        """
+        Sets a strong ETag on a 200 response, hashing the body if there is no version based one,
+        stores it in the response cache, and turns it into a 304 if the client already has it.
+        """
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        if cls.__etags__:
+            if etag is None:
+                etag = hashlib.sha1(response.get_data()).hexdigest()
+            response.set_etag(etag)
+        else:
+            etag = None
+        if cache_key is not None:
+            cache = current_app.extensions['alcohol_cache']
+            cache.set(cache_key, (response.get_data(), response.mimetype, etag))
+        if etag:
+            return response.make_conditional(request)
+        return response
+
+    @classmethod
+    def _get_filter_criteria(cls):
+        """
+        Builds filters from the request args that name an indexed field. ?field=a,b matches any
+        of the values, and suffixes compare instead: ?field__gte=x, __gt, __lt, __lte,
+        ?field__between=x,y and ?field__prefix=abc for string columns.
+        Values are coerced to the column type, raises ValueError if they can't be.
+        """
+        criteria = []
+        for arg, filter_string in request.args.items():
+            if not filter_string:
+                continue
+            if arg in cls.__indexedfields__:
+                field, op = arg, None
+            else:
+                field, _, op = arg.rpartition('__')
+                if field not in cls.__indexedfields__:
+                    continue
+            column = getattr(cls, field)
+            if op is None:
+                filter_list = [_coerce_value(column, x) if x != 'null' else None
+                               for x in filter_string.split(',')]
                 if len(filter_list) > 1:
-                    query = query.filter(column.in_(filter_list))
+                    criteria.append(column.in_(filter_list))
                 else:
-                    query = query.filter(column == filter_list[0])
+                    criteria.append(column == filter_list[0])
+            elif op in FILTER_OPERATORS:
+                criteria.append(FILTER_OPERATORS[op](column, _coerce_value(column, filter_string)))
+            elif op == 'between':
+                bounds = filter_string.split(',')
+                if len(bounds) != 2:
+                    raise ValueError('between takes two values')
+                criteria.append(column.between(*[_coerce_value(column, x) for x in bounds]))
+            elif op == 'prefix':
+                if column.type.python_type is not str:
+                    raise ValueError('prefix only works on string columns')
+                criteria.append(column.startswith(filter_string, autoescape=True))
+            else:
+                raise ValueError('Unknown filter operator: {0}'.format(op))
+        return criteria
 
+    @classmethod
+    def _get_sort_columns(cls):
+        """
+        Parses the sort request argument (or __sort__) into a list of (name, column, desc) tuples.
+        Returns None if any of the rules is not an indexed column.
+        """
+        sort_columns = []
         sort_rules = request.args.get('sort') or cls.__sort__
         if sort_rules:
-            rules = sort_rules.split(',')
-            for rule in rules:
+            for rule in sort_rules.split(','):
                 if rule[0] == '-':
                     col_name = rule[1:]
                     desc = True
@@ -544,63 +2378,345 @@ class APIMixin(Router):
                     col_name = rule
                     desc = False
                 col = getattr(cls, col_name, None)
-                if col and (col.comparator.primary_key or col.comparator.index):
-                    order_by = col
-                    if desc:
-                        order_by = col.desc()
-                else:
-                    return jsonify(messages=api_messages()), 400
+                if not (col and (col.comparator.primary_key or col.comparator.index)):
+                    return None
+                sort_columns.append((col_name, col, desc))
+        return sort_columns
+
+    @classmethod
+    def _get_pagination_mode(cls):
+        if 'after' in request.args:
+            return 'keyset'
+        return cls.__pagination__ or 'offset'
+
+    @classmethod
+    def _get_results(cls, route='index'):
+        """
+        Runs the index query and returns the objects along with a dict of pagination info
+        that gets added to the response. Sets g.failed_validation on bad arguments.
+        """
+        query, params = cls._prepare_results_query(cls._get_query())
+        if query is None:
+            return [], {}
+        query = cls._adjust_query(query, route)
+        return cls._fetch_results(query, params)
+
+    @classmethod
+    def _prepare_results_query(cls, query):
+        """
+        Applies the filters, sort, and loader options from the request to a Query or a select()
+        statement. Returns the query and the pagination parameters, or (None, None) and sets
+        g.failed_validation on bad arguments.
+        """
+        try:
+            criteria = cls._get_filter_criteria()
+        except ValueError:
+            g.failed_validation = True
+            return None, None
+        if criteria:
+            query = query.filter(*criteria)
 
-                query = query.order_by(order_by)
+        sort_columns = cls._get_sort_columns()
+        if sort_columns is None:
+            g.failed_validation = True
+            return None, None
 
         per_page = request.args.get('per_page')
         if per_page is None:
             per_page = cls.__maxresults__
         elif cls.__maxresults__ and int(per_page) > cls.__maxresults__:
-            return jsonify(messages=api_messages()), 400
+            g.failed_validation = True
+            return None, None
+
+        count = cls._get_count_strategy()
+        if count not in COUNT_STRATEGIES:
+            g.failed_validation = True
+            return None, None
+
+        mode = cls._get_pagination_mode()
+        if mode == 'keyset':
+            # the idattr is unique, so it makes the sort order total and the cursor unambiguous
+            if cls.__idattr__ not in [name for name, col, desc in sort_columns]:
+                sort_columns.append((cls.__idattr__, getattr(cls, cls.__idattr__), False))
+
+        for name, col, desc in sort_columns:
+            query = query.order_by(col.desc() if desc else col)
 
         # adjust the query further before pagination
-        query = cls._joinedload_query(query)
-        query = cls._adjust_query(query, route)
+        if mode == 'keyset':
+            # the cursor is built from the sort columns of the last row
+            query = cls._load_only_query(query, [name for name, col, desc in sort_columns])
+        else:
+            query = cls._load_only_query(query)
+        stream = mode != 'keyset' and per_page is None and cls._should_stream()
+        query = cls._eagerload_query(query, stream)
+
+        params = {
+            'sort_columns': sort_columns,
+            'per_page': per_page,
+            'count': count,
+            'mode': mode,
+            'stream': stream
+        }
+        return query, params
+
+    @classmethod
+    def _fetch_results(cls, query, params, session=None):
+        """
+        Runs a prepared index query. Without a session the query is a Flask-SQLAlchemy Query,
+        with one it is a select() statement executed on that (sync) session.
+        """
+        per_page = params['per_page']
+        count = params['count']
+
+        if params['mode'] == 'keyset':
+            return cls._get_keyset_page(query, params['sort_columns'], per_page, count, session)
 
         if per_page is None:
-            objects = query.all()
+            if session is None and params['stream']:
+                # index writes the rows out as they come from the cursor
+                return query.yield_per(cls.__streambatch__), {'stream': True}
+            objects = _fetch_all(query, session)
             total = len(objects)
             has_next = False
-        else:
+        elif count is None and session is None:
             page = request.args.get('page') or 1
             page_results = query.paginate(int(page), int(per_page))
             objects = page_results.items
             total = page_results.total
             has_next = page_results.has_next
-        return objects, total, has_next
+        else:
+            page = int(request.args.get('page') or 1)
+            if page < 1:
+                g.failed_validation = True
+                return [], {}
+            objects, total, has_next = cls._get_offset_page(query, page, int(per_page), count, session)
+
+        page_info = {'has_next': has_next}
+        if count != 'none':
+            page_info['total'] = total
+        return objects, page_info
+
+    @classmethod
+    def _should_stream(cls):
+        stream = request.args.get('stream')
+        if stream is None:
+            return cls.__stream__
+        return stream.lower() in ('true', '1', 'yes')
+
+    @classmethod
+    def _stream_results(cls, query):
+        """
+        Returns a chunked response that serializes the rows from a server side cursor one batch
+        at a time, so memory stays flat no matter how many rows there are. before_return hooks get
+        each batch. Once the first chunk is sent the status code can't change, so failed validation
+        in a hook ends the stream early and leaves the json invalid.
+        """
+        plan = cls._get_request_plan()
+        include_total = cls._get_count_strategy() != 'none'
+        pipeline = cls._get_pipeline('index')
+        batch_size = cls.__streambatch__
+
+        encode = current_app.extensions['alcohol_json']
+
+        def generate():
+            yield b'{"results":['
+            total = 0
+            rows = iter(query)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                batch = pipeline.authorize_batch(batch)
+                if not batch:
+                    continue
+                if not pipeline.before_return(batch):
+                    return
+                with timed('serialize'):
+                    chunk = b','.join(_to_bytes(encode(x._serialize(plan))) for x in batch)
+                yield (b',' if total else b'') + chunk
+                total += len(batch)
+            tail = '],"has_next":false'
+            if include_total:
+                tail += ',"total":{0}'.format(total)
+            yield (tail + '}').encode('ascii')
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    @classmethod
+    def _get_count_strategy(cls):
+        return request.args.get('count') or cls.__count__
+
+    @classmethod
+    def _get_offset_page(cls, query, page, per_page, count, session=None):
+        """
+        Fetches one extra row to find out if there is a next page. With the exact strategy
+        the total comes back with the rows from a window function instead of a second query.
+        """
+        page_query = query.limit(per_page + 1).offset((page - 1) * per_page)
+        if count == 'exact':
+            rows = _fetch_rows(page_query.add_columns(func.count().over()), session)
+            objects = [row[0] for row in rows]
+            if rows:
+                total = rows[0][-1]
+            else:
+                # past the last page there are no rows to carry the window count
+                total = cls._count(query, count, session)
+        else:
+            objects = _fetch_all(page_query, session)
+            total = cls._count(query, count, session)
+        has_next = len(objects) > per_page
+        return objects[:per_page], total, has_next
+
+    @classmethod
+    def _count(cls, query, count, session=None):
+        """
+        Counts the rows a query would return with the given strategy. Returns None for 'none'.
+        """
+        if count == 'none':
+            return None
+        query = query.order_by(None)
+        if count == 'estimated':
+            estimate = cls._estimate_count(query, session)
+            if estimate is not None:
+                return estimate
+        if session is None:
+            return query.count()
+        return session.execute(select(func.count()).select_from(query.subquery())).scalar()
+
+    @classmethod
+    def _estimate_count(cls, query, session=None):
+        """
+        Asks the planner how many rows the query will return. Only Postgres is supported,
+        returns None for other backends or when EXPLAIN fails, so the caller counts instead.
+        """
+        if session is None:
+            session = query.session
+            statement = query.statement
+        else:
+            statement = query
+        connection = session.connection(mapper=class_mapper(cls))
+        dialect = connection.dialect
+        if dialect.name != 'postgresql':
+            return None
+        # expanding IN parameters are only rendered at execution time unless asked for
+        compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+        params = compiled.params
+        if compiled.positional:
+            params = tuple(params[name] for name in compiled.positiontup)
+        try:
+            # a failed statement aborts the whole transaction on Postgres
+            with connection.begin_nested():
+                result = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), params)
+                plan = result.scalar()
+        except DBAPIError:
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @classmethod
+    def _get_keyset_page(cls, query, sort_columns, per_page, count, session=None):
+        """
+        Seeks past the row named by the after cursor instead of using an OFFSET, so deep pages
+        cost the same as the first one. Sort columns should not contain nulls. The seek filter
+        narrows the query, so the total is counted after the cursor is validated but before applying it.
+        """
+        cursor = request.args.get('after')
+        values = None
+        if cursor:
+            try:
+                values = _decode_cursor(cursor, [col for name, col, desc in sort_columns])
+            except (ValueError, TypeError):
+                g.failed_validation = True
+                return [], {}
+        total = cls._count(query, count, session)
+        if values is not None:
+            query = query.filter(_keyset_criterion(sort_columns, values))
+
+        next_cursor = None
+        if per_page is None:
+            objects = _fetch_all(query, session)
+        else:
+            per_page = int(per_page)
+            objects = _fetch_all(query.limit(per_page + 1), session)
+            if len(objects) > per_page:
+                objects = objects[:per_page]
+                last = objects[-1]
+                next_cursor = _encode_cursor([getattr(last, name) for name, col, desc in sort_columns])
+
+        page_info = {'next_cursor': next_cursor}
+        if count != 'none':
+            page_info['total'] = total
+        return objects, page_info
 
     # a little confusion here on what to use, class, static, or normal methods
     # same goes for routes, by that thinking
     # these definitely should be classmethods, i think, but the decorated authorisers and adjusters should be static
+    @classmethod
+    def _build_pipeline(cls, route_name):
+        return Pipeline(
+            route_name,
+            authorizers=[getattr(cls, x) for x in cls.__security__.get(route_name) or []],
+            row_filters=[getattr(cls, x) for x in cls.__rowsecurity__.get(route_name) or []],
+            batch_authorizers=[getattr(cls, x) for x in cls.__batchsecurity__.get(route_name) or []],
+            adjusters=[getattr(cls, x) for x in cls.__adjusters__.get(route_name) or []],
+            before_returns=[getattr(cls, x) for x in cls.__beforereturns__.get(route_name) or []]
+        )
+
+    @classmethod
+    def _get_pipeline(cls, route_name):
+        try:
+            return cls.__pipelines__[route_name]
+        except KeyError:
+            pipeline = cls.__pipelines__[route_name] = cls._build_pipeline(route_name)
+            return pipeline
+
     @classmethod
     def _authorize(cls, route_name, resource=None):
-        func_names = cls.__security__.get(route_name) or []
-        for func_name in func_names:
-            check = getattr(cls, func_name)
-            if not check(resource):
-                return False
-        return True
+        return cls._get_pipeline(route_name).authorize(resource)
 
     @classmethod
     def _before_return(cls, route_name, resource=None):
-        befores = cls.__beforereturns__.get(route_name) or []
-        for before in befores:
-            before_func = getattr(cls, before)
-            before_func(resource)
+        cls._get_pipeline(route_name).before_return(resource)
 
     @classmethod
     def _adjust_query(cls, query, route):
-        query_adjusters = cls.__adjusters__.get(route) or []
-        for adjuster in query_adjusters:
-            adjuster_func = getattr(cls, adjuster)
-            query = adjuster_func(query)
-        return query
+        return cls._get_pipeline(route).adjust_query(query)
+
+    @classmethod
+    async def _authorize_async(cls, route_name, resource=None):
+        return await cls._get_pipeline(route_name).authorize_async(resource)
+
+    @classmethod
+    async def _before_return_async(cls, route_name, resource=None):
+        await cls._get_pipeline(route_name).before_return_async(resource)
+
+    @classmethod
+    async def _adjust_query_async(cls, query, route):
+        return await cls._get_pipeline(route).adjust_query_async(query)
+
+    @classmethod
+    def _get_authorized_obj(cls, pipeline, identifier):
+        """
+        Loads the object a route is for and runs the route's authorization on it. Returns the
+        object and None, or None and the error response.
+        """
+        obj = cls._get_obj_by_id(identifier, pipeline.route)
+        if obj is None:
+            return None, (api_jsonify(messages=api_messages()), 404)
+        if not pipeline.authorize(obj) or not pipeline.authorize_batch([obj]):
+            return None, (api_jsonify(messages=api_messages()), 403)
+        return obj, None
+
+    @classmethod
+    async def _get_authorized_obj_async(cls, pipeline, identifier):
+        obj = await cls._get_obj_by_id_async(identifier, pipeline.route)
+        if obj is None:
+            return None, (api_jsonify(messages=api_messages()), 404)
+        if not await pipeline.authorize_async(obj) or not await pipeline.authorize_batch_async([obj]):
+            return None, (api_jsonify(messages=api_messages()), 403)
+        return obj, None
 
     def _auto_get(self, name):
         value = getattr(self, name)
@@ -628,158 +2744,660 @@ class APIMixin(Router):
                 return None
             func = self._auto_set
         try:
-            func(name, value)
+            return func(name, value)
         except (ValueError, AssertionError):
             g.failed_validation = True
 
-    def _get_field_value(self, name):
-        if name in self.__getters__:
-            func_name = self.__getters__[name]
-            func = getattr(self, func_name)
-            try:
-                field_value = func(name)
-            except TypeError:
-                field_value = func()
-            return field_value
-        return self._auto_get(name)
+    def _is_unique(self, name, value):
+        """
+        For setters of unique fields: whether no other row has the value. With __uniquecheck__
+        set to 'constraint' this doesn't query and the unique constraint of the database is
+        left to catch duplicates, which the write routes answer with 409. Setters of async
+        routes await _is_unique_async instead.
+        """
+        if value == getattr(self, name) or self.__uniquecheck__ == 'constraint':
+            return True
+        if _in_event_loop():
+            # the sync session would block the loop and can't see the AsyncSession's rows
+            raise RuntimeError('Setters of async routes have to await _is_unique_async')
+        cls = self.__class__
+        column = getattr(cls, name)
+        return cls._get_query().filter(column == value).with_entities(column).first() is None
 
-    def _auto_update(self, mapper=None):
+    async def _is_unique_async(self, name, value):
+        """
+        _is_unique for async setters, which queries through the ALCOHOL_ASYNC_SESSION session.
+        """
+        if value == getattr(self, name) or self.__uniquecheck__ == 'constraint':
+            return True
         cls = self.__class__
-        if mapper is None:
-            mapper = class_mapper(cls)
-        for col in mapper.columns:
-            # this order is the listed order except that hybrid properties go first
-            api_info = cls._get_api_info(col.name)
-            set_by = api_info['set_by']
+        column = getattr(cls, name)
+        result = await cls._get_async_session().execute(select(column).filter(column == value).limit(1))
+        return result.first() is None
+
+    def _get_field_value(self, name):
+        try:
+            accessor = self.__serializers__[name]
+        except KeyError:
+            return self._auto_get(name)
+        return accessor(self)
+
+    @classmethod
+    def _get_field_updates(cls, created=False):
+        """
+        Yields (name, value, try_auto) for every field the current request sets, in order.
+        Setters of server set fields only run on updates when a field they depend on is sent.
+        """
+        for name, set_by, depends_on in cls.__updatefields__:
             if set_by == 'json':
-                if col.name in g.fields:
-                    val = g.fields.get(col.name)
-                    self._set_field_value(col.name, val)
+                if name in g.fields:
+                    yield name, g.fields.get(name), True
             elif set_by == 'url':
-                if col.name in request.view_args:
-                    val = request.view_args.get(col.name)
-                    self._set_field_value(col.name, val)
-            elif set_by == 'server':
+                if name in request.view_args:
+                    yield name, request.view_args.get(name), True
+            elif created or depends_on is None or any(x in g.fields for x in depends_on):
                 # important not to let it try to set it from json
-                # requires a @setter decorated function
-                self._set_field_value(name=col.name, try_auto=False)
+                yield name, None, False
+
+    def _auto_update(self):
+        created = not instance_state(self).has_identity
+        for name, value, try_auto in self._get_field_updates(created):
+            self._set_field_value(name, value, try_auto)
+
+    async def _auto_update_async(self):
+        created = not instance_state(self).has_identity
+        for name, value, try_auto in self._get_field_updates(created):
+            pending = self._set_field_value(name, value, try_auto)
+            if inspect.isawaitable(pending):
+                try:
+                    await pending
+                except (ValueError, AssertionError):
+                    g.failed_validation = True
 
     @staticmethod
     def _get_sql_session():
-        return current_app.extensions['sqlalchemy'].db.session
+        """
+        Returns the session of the primary, or in a read only route with ALCOHOL_READ_REPLICAS
+        set, a session on one of the replicas unless the client just wrote something or the
+        route is running in an APIBatch.
+        """
+        primary = current_app.extensions['sqlalchemy'].db.session
+        if not g.get('alcohol_read_only') or g.get('alcohol_batch'):
+            # calls in a batch share the batch's session so they see each other's writes
+            return primary
+        try:
+            return g.alcohol_replica_session
+        except AttributeError:
+            pass
+        replicas = current_app.extensions.get('alcohol_replicas')
+        if replicas is None or _reads_own_writes():
+            return primary
+        g.alcohol_replica_bind, g.alcohol_replica_session = replicas.acquire()
+        return g.alcohol_replica_session
+
+    @classmethod
+    def _get_query(cls):
+        """
+        Returns cls.query on the session _get_sql_session picks.
+        """
+        query = cls.query
+        session = cls._get_sql_session()
+        if session is not current_app.extensions['sqlalchemy'].db.session:
+            query = query.with_session(session)
+        return query
+
+    @staticmethod
+    def _get_async_session():
+        """
+        Returns the AsyncSession for the current request, made with the ALCOHOL_ASYNC_SESSION
+        factory. The async proxy closes it when the request is done.
+        """
+        try:
+            return g.alcohol_async_session
+        except AttributeError:
+            pass
+        factory = current_app.config.get('ALCOHOL_ASYNC_SESSION')
+        if factory is None:
+            raise RuntimeError('Set ALCOHOL_ASYNC_SESSION to an AsyncSession factory to use async routes')
+        g.alcohol_async_session = factory()
+        return g.alcohol_async_session
+
+    @classmethod
+    async def _get_obj_by_id_async(cls, identifier, route):
+        id_col = getattr(cls, cls.__idattr__)
+        query = select(cls).filter(id_col == identifier)
+        if route == 'get':
+            query = cls._load_only_query(query)
+        query = cls._eagerload_query(query)
+        query = await cls._adjust_query_async(query, route)
+        session = cls._get_async_session()
+        result = await session.execute(query.limit(1))
+        return result.unique().scalars().first()
+
+    @classmethod
+    async def _serialize_async(cls, objects, plan=None):
+        """
+        Serializes objects inside the session's greenlet so lazy loads still work, then awaits
+        any values that async getters returned.
+        """
+        session = cls._get_async_session()
+        with timed('serialize'):
+            if plan is None:
+                results = await session.run_sync(
+                    lambda sync_session: [x.as_dict(use_defaults=False) for x in objects])
+            else:
+                results = await session.run_sync(lambda sync_session: [x._serialize(plan) for x in objects])
+            return await _resolve_nested(results)
 
     @classmethod
     def set_g(cls):
         g.fields = request.json or request.form
         g.failed_validation = False
         g.cached_included_fields = {}
+        g.cached_nested_fields = {}
 
     @classmethod
-    @route('', is_auto=True)
+    @route('', is_auto=True, read_only=True)
     def index(cls, **kwargs):
         cls.set_g()
+        pipeline = cls._get_pipeline('index')
         # this kwargs stuff is there for when there are arguments in the prefix or base.
         # how did flask-classy solve this?
-        if not cls._authorize('index', resource=None):
-            return jsonify(messages=api_messages()), 403
-        objects, total, has_next = cls._get_results()
-        cls._before_return('index', objects)
+        if not pipeline.authorize():
+            return api_jsonify(messages=api_messages()), 403
+        cache_key = cls._get_cache_key('index', kwargs)
+        cached = cls._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+        objects, page_info = cls._get_results()
         if g.failed_validation:
-            return jsonify(messages=api_messages()), 400
-        return jsonify(results=[x.as_dict(use_defaults=False) for x in objects],
-                       total=total,
-                       has_next=has_next)
+            return api_jsonify(messages=api_messages()), 400
+        if page_info.get('stream'):
+            return cls._stream_results(objects)
+        objects = pipeline.authorize_batch(objects)
+        if not pipeline.before_return(objects):
+            return api_jsonify(messages=api_messages()), 400
+        etag = None
+        if cls._can_version_etag():
+            versions = [[getattr(x, cls.__idattr__), getattr(x, cls.__versionattr__)] for x in objects]
+            etag = cls._version_etag(versions, page_info)
+            if etag in request.if_none_match:
+                return _not_modified(etag)
+        plan = cls._get_request_plan()
+        with timed('serialize'):
+            results = [x._serialize(plan) for x in objects]
+        response = api_jsonify(results=results, **page_info)
+        return cls._finish_read_response(response, etag, cache_key)
 
     @classmethod
-    @route('/<identifier>', is_auto=True)
+    @route('/<identifier>', is_auto=True, read_only=True)
     def get(cls, **kwargs):
         cls.set_g()
-        obj = cls._get_obj_by_id(kwargs['identifier'], 'get')
-        if obj is None:
-            return jsonify(messages=api_messages()), 404
-        if not cls._authorize('get', resource=obj):
-            return jsonify(messages=api_messages()), 403
-        cls._before_return('get', obj)
-        if g.failed_validation:
-            return jsonify(messages=api_messages()), 400
-        return jsonify(obj.as_dict(use_defaults=False))
+        pipeline = cls._get_pipeline('get')
+        identifier = kwargs['identifier']
+        cache_key = None
+        if not pipeline.authorizers and not pipeline.batch_authorizers:
+            # with per resource checks the object has to be loaded anyway
+            cache_key = cls._get_cache_key('get', kwargs)
+            cached = cls._get_cached_response(cache_key)
+            if cached is not None:
+                return cached
+        can_version = cls._can_version_etag()
+        if can_version and request.if_none_match and not pipeline.authorizers and not pipeline.batch_authorizers \
+                and not pipeline.before_returns:
+            # nothing needs the loaded object, so only the version column has to be read
+            versions = cls._get_version_by_id(identifier, 'get')
+            if versions is not None:
+                etag = cls._version_etag(versions)
+                if etag in request.if_none_match:
+                    return _not_modified(etag)
+        obj, error = cls._get_authorized_obj(pipeline, identifier)
+        if error:
+            return error
+        if not pipeline.before_return(obj):
+            return api_jsonify(messages=api_messages()), 400
+        etag = None
+        if can_version:
+            etag = cls._version_etag([identifier, getattr(obj, cls.__versionattr__)])
+            if etag in request.if_none_match:
+                return _not_modified(etag)
+        with timed('serialize'):
+            result = obj.as_dict(use_defaults=False)
+        return cls._finish_read_response(api_jsonify(result), etag, cache_key)
 
     @classmethod
     @route('', methods=['POST'], is_auto=True)
     def post(cls, **kwargs):
         cls.set_g()
-        if not cls._authorize('post', resource=None):
-            return jsonify(messages=api_messages()), 403
+        pipeline = cls._get_pipeline('post')
+        if not pipeline.authorize():
+            return api_jsonify(messages=api_messages()), 403
         obj = cls()
         obj._auto_update()
-        cls._before_return('post', obj)
-        if g.failed_validation:
-            return jsonify(messages=api_messages()), 400
+        if not pipeline.authorize_batch([obj]):
+            return api_jsonify(messages=api_messages()), 403
+        if not pipeline.before_return(obj):
+            return api_jsonify(messages=api_messages()), 400
         session = cls._get_sql_session()
         session.add(obj)
+        try:
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            return api_jsonify(messages=api_messages()), 409
+        # serialize before the commit expires everything
+        with timed('serialize'):
+            result = obj.as_dict(use_defaults=False)
+        location = obj.get_location()
         session.commit()
-        response = jsonify(obj.as_dict(use_defaults=False))
+        response = api_jsonify(result)
         response.status_code = 201
-        response.headers['Location'] = obj.get_location()
+        response.headers['Location'] = location
         return response
 
     @classmethod
     @route('/<identifier>', methods=['PUT'], is_auto=True)
     def put(cls, **kwargs):
         cls.set_g()
+        pipeline = cls._get_pipeline('put')
         # pragmatic put method that does not require the whole object to be sent back
-        obj = cls._get_obj_by_id(kwargs['identifier'], 'put')
-        if obj is None:
-            return jsonify(messages=api_messages()), 404
-        if not cls._authorize('put', resource=obj):
-            return jsonify(messages=api_messages()), 403
+        if 'put' in cls.__fastroutes__:
+            response = cls._update_by_id(pipeline, kwargs['identifier'])
+            if response is not None:
+                return response
+        obj, error = cls._get_authorized_obj(pipeline, kwargs['identifier'])
+        if error:
+            return error
         obj._auto_update()
-        cls._before_return('put', obj)
-        if g.failed_validation:
-            return jsonify(messages=api_messages()), 400
+        if not pipeline.before_return(obj):
+            return api_jsonify(messages=api_messages()), 400
         session = cls._get_sql_session()
+        try:
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            return api_jsonify(messages=api_messages()), 409
+        with timed('serialize'):
+            result = obj.as_dict(use_defaults=False)
         session.commit()
-        return jsonify(obj.as_dict(use_defaults=False))
+        return api_jsonify(result)
 
     @classmethod
     @route('/<identifier>', methods=['DELETE'], is_auto=True)
     def delete(cls, **kwargs):
         cls.set_g()
-        obj = cls._get_obj_by_id(kwargs['identifier'], 'delete')
-        if obj is None:
-            return jsonify(messages=api_messages()), 404
-        if not cls._authorize('delete', resource=obj):
-            return jsonify(messages=api_messages()), 403
-        cls._before_return('delete', obj)
-        if g.failed_validation:
-            return jsonify(messages=api_messages()), 400
+        pipeline = cls._get_pipeline('delete')
+        if 'delete' in cls.__fastroutes__:
+            return cls._delete_by_id(pipeline, kwargs['identifier'])
+        obj, error = cls._get_authorized_obj(pipeline, kwargs['identifier'])
+        if error:
+            return error
+        if not pipeline.before_return(obj):
+            return api_jsonify(messages=api_messages()), 400
         session = cls._get_sql_session()
         session.delete(obj)
         session.commit()
-        return jsonify(), 204
+        return api_jsonify(), 204
+
+    # async versions of the auto routes, used instead of the sync ones when __async__ is True
+
+    @classmethod
+    async def index_async(cls, **kwargs):
+        cls.set_g()
+        pipeline = cls._get_pipeline('index')
+        if not await pipeline.authorize_async():
+            return api_jsonify(messages=api_messages()), 403
+        cache_key = cls._get_cache_key('index', kwargs)
+        cached = cls._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+        query, params = cls._prepare_results_query(select(cls))
+        if query is None:
+            return api_jsonify(messages=api_messages()), 400
+        query = await pipeline.adjust_query_async(query)
+        session = cls._get_async_session()
+        objects, page_info = await session.run_sync(
+            lambda sync_session: cls._fetch_results(query, params, sync_session))
+        if g.failed_validation:
+            return api_jsonify(messages=api_messages()), 400
+        objects = await pipeline.authorize_batch_async(objects)
+        if not await pipeline.before_return_async(objects):
+            return api_jsonify(messages=api_messages()), 400
+        plan = cls._get_request_plan()
+        results = await cls._serialize_async(objects, plan)
+        return cls._finish_read_response(api_jsonify(results=results, **page_info), cache_key=cache_key)
+
+    @classmethod
+    async def get_async(cls, **kwargs):
+        cls.set_g()
+        pipeline = cls._get_pipeline('get')
+        cache_key = None
+        if not pipeline.authorizers and not pipeline.batch_authorizers:
+            cache_key = cls._get_cache_key('get', kwargs)
+            cached = cls._get_cached_response(cache_key)
+            if cached is not None:
+                return cached
+        obj, error = await cls._get_authorized_obj_async(pipeline, kwargs['identifier'])
+        if error:
+            return error
+        if not await pipeline.before_return_async(obj):
+            return api_jsonify(messages=api_messages()), 400
+        results = await cls._serialize_async([obj])
+        return cls._finish_read_response(api_jsonify(results[0]), cache_key=cache_key)
+
+    @classmethod
+    async def post_async(cls, **kwargs):
+        cls.set_g()
+        pipeline = cls._get_pipeline('post')
+        if not await pipeline.authorize_async():
+            return api_jsonify(messages=api_messages()), 403
+        obj = cls()
+        await obj._auto_update_async()
+        if not await pipeline.authorize_batch_async([obj]):
+            return api_jsonify(messages=api_messages()), 403
+        if not await pipeline.before_return_async(obj):
+            return api_jsonify(messages=api_messages()), 400
+        session = cls._get_async_session()
+        session.add(obj)
+        try:
+            await session.flush()
+        except IntegrityError:
+            await session.rollback()
+            return api_jsonify(messages=api_messages()), 409
+        # serialize before the commit expires everything
+        results = await cls._serialize_async([obj])
+        location = await session.run_sync(lambda sync_session: obj.get_location())
+        await session.commit()
+        response = api_jsonify(results[0])
+        response.status_code = 201
+        response.headers['Location'] = location
+        return response
+
+    @classmethod
+    async def put_async(cls, **kwargs):
+        cls.set_g()
+        pipeline = cls._get_pipeline('put')
+        obj, error = await cls._get_authorized_obj_async(pipeline, kwargs['identifier'])
+        if error:
+            return error
+        await obj._auto_update_async()
+        if not await pipeline.before_return_async(obj):
+            return api_jsonify(messages=api_messages()), 400
+        session = cls._get_async_session()
+        try:
+            await session.flush()
+        except IntegrityError:
+            await session.rollback()
+            return api_jsonify(messages=api_messages()), 409
+        results = await cls._serialize_async([obj])
+        await session.commit()
+        return api_jsonify(results[0])
+
+    @classmethod
+    async def delete_async(cls, **kwargs):
+        cls.set_g()
+        pipeline = cls._get_pipeline('delete')
+        obj, error = await cls._get_authorized_obj_async(pipeline, kwargs['identifier'])
+        if error:
+            return error
+        if not await pipeline.before_return_async(obj):
+            return api_jsonify(messages=api_messages()), 400
+        session = cls._get_async_session()
+        await session.delete(obj)
+        await session.commit()
+        return api_jsonify(), 204
+
+    @classmethod
+    def _get_bulk_items(cls):
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return None
+        return items
+
+    @classmethod
+    def _get_bulk_objects(cls, identifiers, route):
+        """
+        Loads every object named in a bulk request with one query, keyed by identifier.
+        Identifiers that aren't scalars are left out.
+        """
+        id_col = getattr(cls, cls.__idattr__)
+        query = cls._get_query().filter(id_col.in_(set(x for x in identifiers if _is_bulk_identifier(x))))
+        query = cls._adjust_query(query, route)
+        return dict((str(getattr(obj, cls.__idattr__)), obj) for obj in query)
+
+    @classmethod
+    def _bulk_item_error(cls, status, flash_start=None):
+        messages = _flashes_since(flash_start) if flash_start is not None else []
+        default_message = current_app.config.get('API_ERROR_MESSAGE')
+        if default_message:
+            messages.append(default_message)
+        return {'status': status, 'messages': messages}
+
+    @classmethod
+    def _flush_bulk_item(cls, session, savepoint, result, flash_start):
+        """
+        Flushes the changes of one bulk item made since its savepoint began, so an
+        IntegrityError is reported as a 409 for that item. Without a savepoint the item is
+        written with the rest of the batch.
+        """
+        if savepoint is None:
+            return result
+        try:
+            session.flush()
+        except IntegrityError:
+            savepoint.rollback()
+            return cls._bulk_item_error(409, flash_start)
+        savepoint.commit()
+        return result
+
+    @classmethod
+    def _write_bulk(cls, write_items):
+        """
+        Runs write_items(isolate=False), which validates every item and adds or changes the
+        valid ones, then flushes them all at once so the ORM can batch the statements. If that
+        flush hits an IntegrityError everything is rolled back and write_items runs again with
+        isolate=True, which flushes each item in its own savepoint to find the ones at fault.
+        """
+        session = cls._get_sql_session()
+        results = write_items(False)
+        try:
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            results = write_items(True)
+        return cls._bulk_commit(results)
+
+    @classmethod
+    def _bulk_commit(cls, results):
+        """
+        Commits everything the items of a bulk route flushed. The results are serialized
+        before the commit, so the objects aren't loaded again.
+        """
+        session = cls._get_sql_session()
+        _clear_flashes()
+        try:
+            session.flush()
+            with timed('serialize'):
+                results = [x() if callable(x) else x for x in results]
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return api_jsonify(messages=api_messages()), 409
+        return api_jsonify(results=results)
+
+    @classmethod
+    @route('/bulk', methods=['POST'], is_auto=True)
+    def bulk_post(cls, **kwargs):
+        """
+        Creates every object in a json array. Hooks run per item like the post route, items that
+        fail validation or violate a constraint are reported and skipped, and the rest are
+        written in one transaction.
+        """
+        cls.set_g()
+        items = cls._get_bulk_items()
+        if items is None:
+            return api_jsonify(messages=api_messages()), 400
+        pipeline = cls._get_pipeline('post')
+        if not pipeline.authorize():
+            return api_jsonify(messages=api_messages()), 403
+        return cls._write_bulk(functools.partial(cls._bulk_post_items, items, pipeline))
+
+    @classmethod
+    def _bulk_post_items(cls, items, pipeline, isolate):
+        session = cls._get_sql_session()
+        results = []
+        with session.no_autoflush:
+            for item in items:
+                flash_start = _flash_count()
+                if not isinstance(item, dict):
+                    results.append(cls._bulk_item_error(400))
+                    continue
+                g.fields = item
+                g.failed_validation = False
+                obj = cls()
+                obj._auto_update()
+                if not pipeline.authorize_batch([obj]):
+                    results.append(cls._bulk_item_error(403, flash_start))
+                    continue
+                if not pipeline.before_return(obj):
+                    results.append(cls._bulk_item_error(400, flash_start))
+                    continue
+                # begin_nested flushes what is pending, so it has to come before the add
+                savepoint = session.begin_nested() if isolate else None
+                session.add(obj)
+                results.append(cls._flush_bulk_item(
+                    session, savepoint, functools.partial(_bulk_item_result, obj, 201), flash_start))
+        g.failed_validation = False
+        return results
+
+    @classmethod
+    @route('/bulk', methods=['PUT'], is_auto=True)
+    def bulk_put(cls, **kwargs):
+        """
+        Updates every object in a json array. Each item names its object with the __idattr__ field.
+        """
+        cls.set_g()
+        items = cls._get_bulk_items()
+        if items is None:
+            return api_jsonify(messages=api_messages()), 400
+        pipeline = cls._get_pipeline('put')
+        return cls._write_bulk(functools.partial(cls._bulk_put_items, items, pipeline))
+
+    @classmethod
+    def _bulk_put_items(cls, items, pipeline, isolate):
+        identifiers = [x.get(cls.__idattr__) for x in items if isinstance(x, dict)]
+        objects = cls._get_bulk_objects(identifiers, 'put')
+        allowed = set(id(x) for x in pipeline.authorize_batch(list(objects.values())))
+        session = cls._get_sql_session()
+        results = []
+        with session.no_autoflush:
+            for item in items:
+                flash_start = _flash_count()
+                if not isinstance(item, dict) or not _is_bulk_identifier(item.get(cls.__idattr__)):
+                    results.append(cls._bulk_item_error(400))
+                    continue
+                obj = objects.get(str(item[cls.__idattr__]))
+                if obj is None:
+                    results.append(cls._bulk_item_error(404))
+                    continue
+                if id(obj) not in allowed or not pipeline.authorize(obj):
+                    results.append(cls._bulk_item_error(403, flash_start))
+                    continue
+                g.fields = item
+                g.failed_validation = False
+                savepoint = session.begin_nested() if isolate else None
+                obj._auto_update()
+                if not pipeline.before_return(obj):
+                    if savepoint is not None:
+                        savepoint.rollback()
+                    else:
+                        session.expire(obj)
+                    results.append(cls._bulk_item_error(400, flash_start))
+                    continue
+                results.append(cls._flush_bulk_item(
+                    session, savepoint, functools.partial(_bulk_item_result, obj, 200), flash_start))
+        g.failed_validation = False
+        return results
+
+    @classmethod
+    @route('/bulk', methods=['DELETE'], is_auto=True)
+    def bulk_delete(cls, **kwargs):
+        """
+        Deletes every object in a json array of identifiers (or objects with the __idattr__ field).
+        """
+        cls.set_g()
+        items = cls._get_bulk_items()
+        if items is None:
+            return api_jsonify(messages=api_messages()), 400
+        pipeline = cls._get_pipeline('delete')
+        return cls._write_bulk(functools.partial(cls._bulk_delete_items, items, pipeline))
+
+    @classmethod
+    def _bulk_delete_items(cls, items, pipeline, isolate):
+        identifiers = [x.get(cls.__idattr__) if isinstance(x, dict) else x for x in items]
+        objects = cls._get_bulk_objects(identifiers, 'delete')
+        allowed = set(id(x) for x in pipeline.authorize_batch(list(objects.values())))
+        session = cls._get_sql_session()
+        results = []
+        deleted = set()
+        for identifier in identifiers:
+            flash_start = _flash_count()
+            if identifier is not None and not _is_bulk_identifier(identifier):
+                results.append(cls._bulk_item_error(400))
+                continue
+            obj = objects.get(str(identifier)) if identifier is not None else None
+            if obj is None or id(obj) in deleted:
+                results.append(cls._bulk_item_error(404))
+                continue
+            if id(obj) not in allowed or not pipeline.authorize(obj):
+                results.append(cls._bulk_item_error(403, flash_start))
+                continue
+            g.failed_validation = False
+            if not pipeline.before_return(obj):
+                results.append(cls._bulk_item_error(400, flash_start))
+                continue
+            savepoint = session.begin_nested() if isolate else None
+            session.delete(obj)
+            result = cls._flush_bulk_item(session, savepoint, {'status': 204}, flash_start)
+            if result['status'] == 204:
+                deleted.add(id(obj))
+            results.append(result)
+        g.failed_validation = False
+        return results
 
     @classmethod
-    @route('/meta', is_auto=True)
+    @route('/meta', is_auto=True, read_only=True)
     def meta(cls, **kwargs):
-        if not cls._authorize('meta'):
-            return jsonify(messages=api_messages()), 403
-        cls._before_return('meta')
-        return jsonify(cls.__metas__)
+        pipeline = cls._get_pipeline('meta')
+        if not pipeline.authorize():
+            return api_jsonify(messages=api_messages()), 403
+        cache_key = cls._get_cache_key('meta', kwargs)
+        cached = cls._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+        pipeline.before_return()
+        return cls._finish_read_response(api_jsonify(cls.__metas__), cache_key=cache_key)
 
     def as_dict(self, use_defaults=True):
         if use_defaults:
             # don't listen to the request and only return the default fields
-            fields = self.__defaultfields__
+            plan = self.__defaultplan__
         else:
-            fields = self.__class__._get_included_fields()
+            cls = self.__class__
+            plan = cls._get_request_plan()
+        return self._serialize(plan)
 
+    def _serialize(self, plan, extras=None):
         result_dict = {}
-        for field in fields:
-            result_dict[field] = self._get_field_value(field)
-
-        add_dict = self.more_json()
-        for key in add_dict:
-            result_dict[key] = add_dict[key]
+        for name, accessor in plan:
+            result_dict[name] = accessor(self)
+
+        if extras is None:
+            result_dict.update(self.more_json())
+        elif extras:
+            # a nested sparse fieldset only keeps the more_json keys it asked for
+            more = self.more_json()
+            result_dict.update((key, more[key]) for key in extras if key in more)
         return result_dict
 
     def more_json(self):
@@ -812,5 +3430,150 @@ class APIMeta(Router):
             prefix_str = prefix_str.strip('/')
             if not cls.__routeprefix__ or rule_str.startswith(prefix_str):
                 rules.append([str(rule), list(rule.methods)])
-        return jsonify(rules=rules)
+        return api_jsonify(rules=rules)
+
+
+class APIMetrics(Router):
+    """
+    Serves the metrics collected when ALCOHOL_METRICS is on in the Prometheus text format.
+    """
+
+    __routebase__ = 'metrics'
+    __routeprefix__ = 'api'
+
+    @classmethod
+    @route('')
+    def get(cls):
+        metrics = current_app.extensions.get('alcohol_metrics')
+        if metrics is None:
+            return api_jsonify(messages=api_messages()), 404
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+class APIBatch(Router):
+    """
+    Runs a JSON list of {method, path, query, body} calls in one request. Each call goes
+    through the app's routes in-process, on the batch's app context and database session, and
+    the responses come back together in order. With ?atomic=true every call runs in a
+    savepoint and the batch only commits if all of them succeed, otherwise everything is
+    rolled back and the batch answers 409. Async routes use their own session, so they are
+    left out of the atomic transaction.
+    """
+
+    __routebase__ = 'batch'
+    __routeprefix__ = 'api'
+    __maxcalls__ = 50  # the most calls one batch can make
+
+    @classmethod
+    @route('', methods=['POST'])
+    def post(cls):
+        calls = request.get_json(silent=True)
+        if not isinstance(calls, list):
+            flash('The batch must be a JSON list of calls', 'error')
+            return api_jsonify(messages=api_messages()), 400
+        if len(calls) > cls.__maxcalls__:
+            flash('A batch can make at most {0} calls'.format(cls.__maxcalls__), 'error')
+            return api_jsonify(messages=api_messages()), 400
+
+        atomic = request.args.get('atomic', '').lower() in ('true', '1', 'yes')
+        session = current_app.extensions['sqlalchemy'].db.session
+        g.alcohol_batch = True
+        succeeded = True
+        wrote = False
+        results = []
+        for call in calls:
+            savepoint = cls._begin_call(session) if atomic else None
+            status, response_headers, body = cls._dispatch(call)
+            if savepoint is not None and savepoint.is_active:
+                if status < 400:
+                    savepoint.commit()
+                else:
+                    savepoint.rollback()
+            succeeded = succeeded and status < 400
+            wrote = wrote or (status < 400 and cls._is_write(call))
+            results.append((status, response_headers, body))
+        if atomic:
+            if succeeded:
+                session.commit()
+            else:
+                session.rollback()
+                wrote = False
+        # only a batch that changed something keeps the client's reads on the primary
+        g.alcohol_read_only = not wrote
+
+        encode = current_app.extensions.get('alcohol_json', default_json_encoder)
+        with timed('encode'):
+            chunks = []
+            for status, response_headers, body in results:
+                # the bodies are already encoded, so they are spliced in instead of parsed
+                head = _to_bytes(encode({'status': status, 'headers': response_headers}))
+                chunks.append(head[:-1] + b',"body":' + body + b'}')
+            data = b'{"responses":[' + b','.join(chunks) + b']}'
+        response = Response(data, mimetype='application/json')
+        if atomic and not succeeded:
+            response.status_code = 409
+        return response
+
+    @staticmethod
+    def _is_write(call):
+        return isinstance(call, dict) and str(call.get('method') or 'GET').upper() not in ('GET', 'HEAD', 'OPTIONS')
 
+    @classmethod
+    def _begin_call(cls, session):
+        """
+        Opens the savepoint an atomic call runs in. pysqlite doesn't emit BEGIN until the first
+        write, so a SAVEPOINT would start the transaction itself and its RELEASE would commit;
+        the outer transaction is begun explicitly first.
+        """
+        connection = session.connection()
+        if connection.dialect.driver == 'pysqlite' and not connection.connection.in_transaction:
+            connection.exec_driver_sql('BEGIN')
+        return session.begin_nested()
+
+    @classmethod
+    def _dispatch(cls, call):
+        """
+        Runs one call of the batch and returns its status, headers and encoded JSON body.
+        """
+        encode = current_app.extensions.get('alcohol_json', default_json_encoder)
+        if not isinstance(call, dict) or not isinstance(call.get('path'), str) \
+                or not call['path'].startswith('/'):
+            body = encode({'messages': ['Each call needs a path starting with /']})
+            return 400, {}, _to_bytes(body)
+
+        headers = [(key, value) for key, value in request.headers
+                   if key not in ('Content-Type', 'Content-Length')]
+        builder = EnvironBuilder(path=call['path'], base_url=request.url_root,
+                                 method=str(call.get('method') or 'GET').upper(),
+                                 query_string=call.get('query'), headers=headers,
+                                 json=call.get('body'),
+                                 environ_base={'REMOTE_ADDR': request.remote_addr})
+        batch_endpoint = request.endpoint
+        saved = g.__dict__.copy()
+        try:
+            with current_app.request_context(builder.get_environ()):
+                if request.endpoint == batch_endpoint:
+                    body = encode({'messages': ['A batch cannot call itself']})
+                    return 400, {}, _to_bytes(body)
+                try:
+                    response = current_app.full_dispatch_request()
+                except Exception:
+                    current_app.logger.exception('Batch call to %s failed', call['path'])
+                    current_app.extensions['sqlalchemy'].db.session.rollback()
+                    return 500, {}, _to_bytes(encode({'messages': []}))
+                try:
+                    data = response.get_data()
+                finally:
+                    response.close()
+        finally:
+            # the calls share the batch's app context, so each one starts from the batch's g
+            g.__dict__.clear()
+            g.__dict__.update(saved)
+
+        response_headers = dict((key, value) for key, value in response.headers
+                                if key not in ('Content-Type', 'Content-Length', 'Set-Cookie'))
+        if not data:
+            data = b'null'
+        elif not response.is_json:
+            data = _to_bytes(encode(data.decode(response.charset, 'replace')))
+        return response.status_code, response_headers, data
@@ -0,0 +1,6 @@
+"""
+    Flask-Alcohol benchmarks
+    ------------------------
+    Small, self contained benchmarks for Flask-Alcohol. They run against SQLite
+    so they can be used anywhere Flask-SQLAlchemy is installed.
+"""
@@ -0,0 +1,4 @@
+from flask_alcohol.bench.api import main
+
+
+main()
@@ -0,0 +1,204 @@
+"""
+Benchmarks the auto generated API end to end. Seeds a SQLite database with the models from
+flask_alcohol.bench.models, drives every auto route through the Werkzeug test client, and reports
+throughput, latency percentiles, queries per request, and memory as json so runs can be diffed.
+
+    flask-alcohol-bench --rows 1000 100000 --requests 200 --threads 8 > before.json
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from flask_alcohol.bench.models import db, create_app, seed
+from sqlalchemy import event
+import flask_alcohol
+import sqlalchemy
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+
+DEFAULT_ROWS = (1000, 100000, 1000000)
+
+
+class QueryCounter(object):
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def reset(self):
+        with self._lock:
+            count = self.count
+            self.count = 0
+        return count
+
+
+def build_scenarios(rows):
+    """
+    Returns (name, make_request) pairs. make_request takes the request number and returns the
+    method, url, and json body for it.
+    """
+    new_posts = itertools.count()
+    deleted_galleries = itertools.count(1)
+    rng = random.Random(rows)
+
+    def index(n):
+        return 'GET', '/api/posts?per_page=50&page={0}'.format(rng.randint(1, max(rows // 50, 1))), None
+
+    def index_include(n):
+        return 'GET', '/api/posts?per_page=50&include=author,project,preview,is_cut', None
+
+    def get(n):
+        return 'GET', '/api/posts/post_{0}'.format(rng.randrange(rows)), None
+
+    def post(n):
+        return 'POST', '/api/posts', {'title': 'bench post {0}'.format(next(new_posts)), 'body': 'new', 'order': n}
+
+    def put(n):
+        return 'PUT', '/api/posts/post_{0}'.format(rng.randrange(rows)), {'order': n}
+
+    def delete(n):
+        return 'DELETE', '/api/galleries/{0}'.format(next(deleted_galleries)), None
+
+    def meta(n):
+        return 'GET', '/api/posts/meta', None
+
+    return [
+        ('index', index),
+        ('index_include', index_include),
+        ('get', get),
+        ('post', post),
+        ('put', put),
+        ('delete', delete),
+        ('meta', meta)
+    ]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+def run_scenario(app, make_request, requests, threads):
+    lock = threading.Lock()
+    numbers = iter(range(requests))
+    latencies = []
+    errors = []
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                try:
+                    n = next(numbers)
+                except StopIteration:
+                    return
+                method, url, body = make_request(n)
+            start = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(worker) for _ in range(threads)]:
+                future.result()
+    else:
+        worker()
+    wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+
+def run(rows_list=DEFAULT_ROWS, requests=200, threads=8, scenarios=None, trace_memory=False):
+    results = []
+    for rows in rows_list:
+        tmpdir = tempfile.mkdtemp(prefix='flask-alcohol-bench-')
+        try:
+            app = create_app('sqlite:///' + os.path.join(tmpdir, 'bench.db'))
+            with app.app_context():
+                seed_start = time.perf_counter()
+                seed(rows)
+                seed_seconds = time.perf_counter() - seed_start
+                counter = QueryCounter(db.engine)
+            modes = [('single', 1)]
+            if threads > 1:
+                modes.append(('threaded', threads))
+            # built once so the threaded run keeps creating and deleting new rows
+            scenario_list = build_scenarios(rows)
+            for mode, workers in modes:
+                for name, make_request in scenario_list:
+                    if scenarios and name not in scenarios:
+                        continue
+                    counter.reset()
+                    if trace_memory:
+                        tracemalloc.start()
+                    latencies, errors, wall = run_scenario(app, make_request, requests, workers)
+                    peak_memory = None
+                    if trace_memory:
+                        peak_memory = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                    results.append({
+                        'rows': rows,
+                        'seed_seconds': seed_seconds,
+                        'scenario': name,
+                        'mode': mode,
+                        'threads': workers,
+                        'requests': len(latencies),
+                        'errors': len(errors),
+                        'throughput': len(latencies) / wall if wall else None,
+                        'p50_ms': percentile(latencies, 50) * 1000,
+                        'p99_ms': percentile(latencies, 99) * 1000,
+                        'queries_per_request': counter.reset() / float(len(latencies) or 1),
+                        'peak_traced_memory_bytes': peak_memory
+                    })
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    return {
+        'flask_alcohol': flask_alcohol.__version__,
+        'python': platform.python_version(),
+        'sqlalchemy': sqlalchemy.__version__,
+        # the process' peak only grows, so it is reported for the whole run and not per scenario
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the routes Flask-Alcohol generates')
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS),
+                        help='seed sizes to run the scenarios against')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--threads', type=int, default=8, help='thread pool size for the threaded run, 1 to skip it')
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        help='only run this scenario, can be repeated')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='report peak traced memory per scenario, slows everything down')
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.rows, args.requests, args.threads, args.scenarios, args.trace_memory), indent=2))
+
+
+if __name__ == '__main__':
+    main()
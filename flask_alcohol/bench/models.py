@@ -0,0 +1,201 @@
+"""
+Models shaped like the ones in example/app.py, without the Postgres only column types, so
+the benchmarks can run on SQLite.
+"""
+
+from flask import Flask, request, g, flash, has_request_context
+from flask_sqlalchemy import SQLAlchemy
+from flask_alcohol import APIMixin, APIMeta, setter, getter, extra_field
+from sqlalchemy import bindparam, func
+from datetime import datetime
+
+
+db = SQLAlchemy()
+
+PREVIEW_CHARS = 300
+LOREM = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt '
+         'ut labore et dolore magna aliqua ') * 20
+
+
+def get_preview_chars():
+    if has_request_context():
+        return int(request.args.get('preview_chars') or PREVIEW_CHARS)
+    return PREVIEW_CHARS
+
+
+def url_safe_string(value):
+    return ''.join(x for x in value.lower().replace(' ', '_') if x.isalnum() or x in '_-')
+
+
+class User(db.Model, APIMixin):
+    __tablename__ = 'users'
+    __autoroutes__ = ['index', 'get', 'meta']
+    __requiredfields__ = ['first_name', 'last_name', 'roles']
+
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.Unicode, nullable=False, default='', index=True)
+    pw_hash = db.Column(db.Unicode, nullable=False, default='', info={'public': False})
+    first_name = db.Column(db.Unicode(50), nullable=False, default='')
+    last_name = db.Column(db.Unicode(50), nullable=False, default='')
+    description = db.Column(db.UnicodeText, nullable=False, default='')
+    roles = db.Column(db.JSON, default=[])
+
+    posts = db.relationship('Post', backref=db.backref('author', lazy='joined', info={'public': True}),
+                            order_by='Post.id')
+
+    def is_admin(self):
+        return 'admin' in (self.roles or [])
+
+    def full_name(self):
+        return self.first_name + ' ' + self.last_name
+
+    def more_json(self):
+        return {
+            'is_admin': self.is_admin(),
+            'full_name': self.full_name()
+        }
+
+
+class Project(db.Model, APIMixin):
+    __tablename__ = 'projects'
+    __autoroutes__ = ['index', 'get', 'post', 'put', 'delete', 'meta']
+    __idattr__ = 'slug'
+    __uniquecheck__ = 'constraint'
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.Unicode, nullable=False, default='', info={'set_by': 'json'})
+    slug = db.Column(db.Unicode, nullable=False, default='', index=True, unique=True, info={'set_by': 'server'})
+    description = db.Column(db.UnicodeText, nullable=False, default='', info={'set_by': 'json'})
+    theme = db.Column(db.Unicode(20), nullable=False, default='default', info={'set_by': 'json'})
+
+    posts = db.relationship('Post', order_by='Post.id', back_populates='project', info={'public': True})
+
+    @setter('slug', depends_on=['slug', 'title'])
+    def set_slug(self, name, value):
+        value = g.fields.get('slug') or g.fields.get('title') or self.slug
+        slug = url_safe_string(value)[:50]
+        if not self._is_unique('slug', slug):
+            g.failed_validation = True
+            flash('This slug is not unique')
+            return None
+        self.slug = slug
+
+    @setter('theme')
+    def set_theme(self, name, value):
+        self.theme = value or 'default'
+
+
+class Post(db.Model, APIMixin):
+    __tablename__ = 'posts'
+    __autoroutes__ = ['index', 'get', 'post', 'put', 'delete', 'meta']
+    __idattr__ = 'slug'
+    __uniquecheck__ = 'constraint'
+
+    id = db.Column(db.Integer, primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='SET NULL'), index=True,
+                          info={'set_by': 'json'})
+    project_id = db.Column(db.Integer, db.ForeignKey(Project.id, ondelete='CASCADE'), index=True,
+                           info={'set_by': 'json'})
+    order = db.Column(db.Integer, nullable=False, default=0, index=True, info={'set_by': 'json'})
+    slug = db.Column(db.Unicode, nullable=False, default='', index=True, unique=True, info={'set_by': 'server'})
+    title = db.Column(db.Unicode, nullable=False, default='', info={'set_by': 'json'})
+    body = db.Column(db.UnicodeText, nullable=False, default='', info={'set_by': 'json'})
+    description = db.Column(db.UnicodeText, nullable=False, default='', info={'set_by': 'json'})
+    first_published_at = db.Column(db.DateTime, index=True, nullable=False, default=datetime.utcnow)
+    last_published_at = db.Column(db.DateTime, index=True, info={'set_by': 'server'})
+
+    project = db.relationship('Project', lazy='joined', back_populates='posts', info={'public': True})
+
+    # rescanning the body is only needed when the post or ?preview_chars= changes
+    @extra_field(info={'defer': True}, requires=['body'], memoize='app', vary=get_preview_chars)
+    def preview(self, *args):
+        preview_chars = int(request.args.get('preview_chars') or PREVIEW_CHARS)
+        if len(self.body) > preview_chars:
+            return self.body[:self.body.rfind(' ', 0, preview_chars)]
+        return self.body
+
+    @extra_field(info={'defer': True}, expression=lambda cls: func.length(cls.body) > bindparam(
+        'preview_chars', callable_=get_preview_chars, type_=db.Integer))
+    def is_cut(self, *args):
+        return len(self.body) > get_preview_chars()
+
+    @setter('slug', depends_on=['slug', 'title'])
+    def set_slug(self, name, value):
+        value = g.fields.get('slug') or g.fields.get('title') or self.slug
+        slug = url_safe_string(value)[:50]
+        if not self._is_unique('slug', slug):
+            g.failed_validation = True
+            flash('This slug is not unique')
+            return None
+        self.slug = slug
+
+    @getter('first_published_at', 'last_published_at')
+    def get_isoformat(self, name):
+        val = getattr(self, name)
+        return val.isoformat() if val else None
+
+    @setter('last_published_at', depends_on=['publish'])
+    def set_last_published_at(self, name, value):
+        if g.fields.get('publish'):
+            self.last_published_at = datetime.utcnow()
+
+
+class Gallery(db.Model, APIMixin):
+    __tablename__ = 'galleries'
+    __autoroutes__ = ['index', 'get', 'post', 'put', 'delete', 'meta']
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey(Project.id, ondelete='CASCADE'), index=True,
+                           info={'set_by': 'json'})
+    title = db.Column(db.Unicode, nullable=False, default='', info={'set_by': 'json'})
+    images = db.Column(db.JSON, nullable=False, default=[], info={'set_by': 'json'})
+
+
+MODELS = (User, Project, Post, Gallery)
+
+
+def create_app(database_uri='sqlite://', **config):
+    """
+    Builds an app with every benchmark model registered.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='flask-alcohol-bench',
+        SQLALCHEMY_DATABASE_URI=database_uri,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        ROUTE_PREFIX='api'
+    )
+    app.config.update(config)
+    db.init_app(app)
+    for model in MODELS:
+        model.register(app)
+    APIMeta.register(app)
+    return app
+
+
+def seed(rows, users=10, projects=10, batch_size=10000):
+    """
+    Creates the tables and fills them with `rows` posts and galleries. Must be called inside an
+    app context.
+    """
+    db.drop_all()
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'id': i + 1, 'email': 'user{0}@example.com'.format(i), 'first_name': 'First{0}'.format(i),
+         'last_name': 'Last{0}'.format(i), 'roles': ['admin'] if i == 0 else []}
+        for i in range(users)])
+    db.session.execute(Project.__table__.insert(), [
+        {'id': i + 1, 'title': 'Project {0}'.format(i), 'slug': 'project_{0}'.format(i)}
+        for i in range(projects)])
+    now = datetime.utcnow()
+    for start in range(0, rows, batch_size):
+        stop = min(start + batch_size, rows)
+        db.session.execute(Post.__table__.insert(), [
+            {'id': i + 1, 'author_id': i % users + 1, 'project_id': i % projects + 1, 'order': i,
+             'slug': 'post_{0}'.format(i), 'title': 'Post {0}'.format(i), 'body': LOREM,
+             'first_published_at': now, 'last_published_at': now}
+            for i in range(start, stop)])
+        db.session.execute(Gallery.__table__.insert(), [
+            {'id': i + 1, 'project_id': i % projects + 1, 'title': 'Gallery {0}'.format(i), 'images': []}
+            for i in range(start, stop)])
+    db.session.commit()
@@ -0,0 +1,81 @@
+"""
+Microbenchmark for as_dict. Compares the compiled serializer plans built by APIMixin.register
+against the reflective path that looked up getters and guessed their signatures per field.
+
+    python -m flask_alcohol.bench.serializer --rows 500 --repeat 20
+"""
+
+from flask_alcohol import APIMixin
+from sqlalchemy.orm.collections import InstrumentedList
+from flask_alcohol.bench.models import db, create_app, seed, Post
+import argparse
+import json
+import timeit
+
+
+def legacy_get_field_value(obj, name):
+    if name in obj.__getters__:
+        func = getattr(obj, obj.__getters__[name])
+        try:
+            return func(name)
+        except TypeError:
+            return func()
+    value = getattr(obj, name)
+    if type(value) == InstrumentedList:
+        return [legacy_as_dict(x, x.__defaultfields__) for x in value]
+    if isinstance(value, APIMixin):
+        return legacy_as_dict(value, value.__defaultfields__)
+    return value
+
+
+def legacy_as_dict(obj, fields):
+    result_dict = {}
+    for field in fields:
+        result_dict[field] = legacy_get_field_value(obj, field)
+    add_dict = obj.more_json()
+    for key in add_dict:
+        result_dict[key] = add_dict[key]
+    return result_dict
+
+
+def run(rows=500, repeat=20, query_string='include=author,project,preview,is_cut'):
+    app = create_app()
+    with app.app_context():
+        seed(rows)
+    with app.test_request_context('/api/posts?' + query_string):
+        Post.set_g()
+        # loads the SQL backed extra fields with the rows like the routes do
+        objects = Post._load_only_query(Post.query.order_by(Post.id)).limit(rows).all()
+        fields = Post._get_included_fields()
+        plan = Post._get_serializer_plan(fields)
+
+        compiled = [x._serialize(plan) for x in objects]
+        legacy = [legacy_as_dict(x, fields) for x in objects]
+        assert compiled == legacy, 'compiled plan and legacy path disagree'
+
+        legacy_time = min(timeit.repeat(lambda: [legacy_as_dict(x, fields) for x in objects],
+                                        number=1, repeat=repeat))
+        compiled_time = min(timeit.repeat(lambda: [x._serialize(plan) for x in objects],
+                                          number=1, repeat=repeat))
+        db.session.remove()
+
+    return {
+        'rows': rows,
+        'fields': sorted(fields),
+        'legacy_seconds': legacy_time,
+        'compiled_seconds': compiled_time,
+        'speedup': legacy_time / compiled_time if compiled_time else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare compiled as_dict plans with the reflective path')
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--query', default='include=author,project,preview,is_cut')
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.rows, args.repeat, args.query), indent=2))
+
+
+if __name__ == '__main__':
+    main()
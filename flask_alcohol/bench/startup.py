@@ -0,0 +1,200 @@
+"""
+Startup benchmark for register. Builds N generated models and times introspecting them with
+the inspect.getmembers pass register used to make, with the single pass over the MRO, and
+registering them on a fresh app, on a second app in the same process, and from a snapshot.
+
+    python -m flask_alcohol.bench.startup --models 300 --repeat 3
+"""
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from flask_alcohol import APIMixin, authorizes, adjusts_query, setter, getter, extra_field, \
+    save_registry_snapshot, _get_members, _registries, _snapshots
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.orm.properties import ColumnProperty
+import argparse
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+import timeit
+
+
+def make_models(count):
+    db = SQLAlchemy()
+    models = []
+    for idx in range(count):
+        attrs = {
+            '__tablename__': 'model_{0}'.format(idx),
+            '__autoroutes__': ['index', 'get', 'post', 'put', 'delete', 'meta'],
+            'id': db.Column(db.Integer, primary_key=True),
+            'slug': db.Column(db.Unicode, nullable=False, default='', index=True, info={'set_by': 'server'}),
+            'title': db.Column(db.Unicode, nullable=False, default='', info={'set_by': 'json'}),
+            'body': db.Column(db.UnicodeText, nullable=False, default='', info={'set_by': 'json'}),
+            'order': db.Column(db.Integer, nullable=False, default=0, index=True, info={'set_by': 'json'}),
+            'secret': db.Column(db.Unicode, default='', info={'public': False}),
+            'published_at': db.Column(db.DateTime, index=True),
+            'set_slug': setter('slug')(lambda self, name, value: setattr(self, 'slug', self.title.lower())),
+            'get_title': getter('title')(lambda self, name: self.title.strip()),
+            'preview': extra_field(requires=['body'])(lambda self: self.body[:10]),
+            'authorize_changes': staticmethod(authorizes('post', 'put', 'delete')(lambda resource: True)),
+            'visible': staticmethod(adjusts_query('index', 'get')(lambda query: query))
+        }
+        if models:
+            parent = models[-1]
+            attrs['parent_id'] = db.Column(db.Integer, db.ForeignKey(parent.id), index=True,
+                                           info={'set_by': 'json'})
+            attrs['parent'] = db.relationship(parent, info={'public': True})
+        models.append(type('Model{0}'.format(idx), (db.Model, APIMixin), attrs))
+    return db, models
+
+
+def legacy_introspect(cls):
+    """
+    The registry register built before, with inspect.getmembers, which was also called once
+    more by Router.register to find the routes.
+    """
+    routes = []
+    for name, value in inspect.getmembers(cls):
+        if hasattr(value, '_rule_cache') and name in value._rule_cache:
+            routes.append((name, value._rule_cache['is_auto'], value._rule_cache[name]))
+    registry = {
+        'routes': routes,
+        'security': {},
+        'beforereturns': {},
+        'adjusters': {},
+        'cachekeys': {},
+        'setters': {},
+        'getters': {},
+        'infos': {},
+        'metas': {},
+        'defaultfields': set(),
+        'indexedfields': set(),
+        'lazyrelationships': set(),
+        'loadstrategies': {}
+    }
+    hooks = [('_check_cache', 'security'), ('_before_cache', 'beforereturns'),
+             ('_adjuster_cache', 'adjusters'), ('_cachekey_cache', 'cachekeys')]
+    for name, value in inspect.getmembers(cls):
+        if type(value) == InstrumentedAttribute and not name.startswith('_'):
+            if type(value.comparator) == ColumnProperty.Comparator:
+                api_info = cls.__columndefaults__.copy()
+                api_info.update(value.comparator.info)
+                indexed = bool(value.comparator.primary_key or value.comparator.index)
+                if indexed:
+                    registry['indexedfields'].add(name)
+                editable = api_info['set_by'] == 'json'
+            else:
+                api_info = cls.__relationshipdefaults__.copy()
+                api_info.update(value.comparator.info)
+                strategy = cls._predict_load_strategy(api_info, value.comparator.property)
+                if strategy:
+                    registry['loadstrategies'][name] = strategy
+                registry['lazyrelationships'].add(name)
+                indexed = False
+                editable = False
+            registry['infos'][name] = api_info
+            if api_info['public'] and not api_info['defer']:
+                registry['defaultfields'].add(name)
+            meta_dict = {'indexed': indexed, 'editable': editable}
+            if editable:
+                meta_dict['input_type'] = cls._predict_input_type(api_info, value.comparator)
+                meta_dict['required'] = not value.comparator.nullable
+            registry['metas'][name] = meta_dict
+        elif hasattr(value, '_extra_cache'):
+            api_info = cls.__columndefaults__.copy()
+            api_info['indexed'] = False
+            api_info.update(value.__dict__['_extra_cache'])
+            if api_info['public']:
+                registry['getters'][name] = name
+                registry['infos'][name] = api_info
+                if not api_info['defer']:
+                    registry['defaultfields'].add(name)
+                registry['metas'][name] = {'indexed': False, 'editable': False}
+        elif hasattr(value, '_setter_cache'):
+            for field_name in value.__dict__['_setter_cache']:
+                registry['setters'][field_name] = name
+        elif hasattr(value, '_getter_cache'):
+            for field_name in value.__dict__['_getter_cache']:
+                registry['getters'][field_name] = name
+        else:
+            for attr, key in hooks:
+                if hasattr(value, attr):
+                    for route_name in value.__dict__[attr]:
+                        registry[key].setdefault(route_name, []).append(name)
+                    break
+    return registry
+
+
+def create_app(db, **config):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False,
+                      ROUTE_PREFIX='api', **config)
+    db.init_app(app)
+    return app
+
+
+def register_all(app, models):
+    started = time.perf_counter()
+    for model in models:
+        model.register(app)
+    return time.perf_counter() - started
+
+
+def run(models=300, repeat=3):
+    db, classes = make_models(models)
+    app = create_app(db)
+    with app.app_context():
+        for model in classes:
+            class_mapper(model)
+            registry = model._introspect(_get_members(model))
+            legacy = legacy_introspect(model)
+            assert dict((x, registry[x]) for x in legacy) == legacy, \
+                'single pass and legacy introspection disagree for {0}'.format(model.__name__)
+        legacy_time = min(timeit.repeat(lambda: [legacy_introspect(x) for x in classes],
+                                        number=1, repeat=repeat))
+        single_time = min(timeit.repeat(lambda: [x._introspect(_get_members(x)) for x in classes],
+                                        number=1, repeat=repeat))
+
+    for model in classes:
+        _registries.pop(model, None)
+    cold_time = register_all(app, classes)
+    warm_time = register_all(create_app(db), classes)
+
+    tmpdir = tempfile.mkdtemp(prefix='alcohol-startup-')
+    try:
+        path = os.path.join(tmpdir, 'registry.pickle')
+        save_registry_snapshot(path)
+        _snapshots.pop(path, None)
+        for model in classes:
+            _registries.pop(model, None)
+        snapshot_time = register_all(create_app(db, ALCOHOL_REGISTRY_SNAPSHOT=path), classes)
+        snapshot_bytes = os.path.getsize(path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return {
+        'models': models,
+        'legacy_introspect_seconds': legacy_time,
+        'single_pass_introspect_seconds': single_time,
+        'speedup': legacy_time / single_time if single_time else None,
+        'register_cold_seconds': cold_time,
+        'register_second_app_seconds': warm_time,
+        'register_from_snapshot_seconds': snapshot_time,
+        'snapshot_bytes': snapshot_bytes
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time model registration for many models')
+    parser.add_argument('--models', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.models, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,8 +7,13 @@ setup(name='flask_alcohol',
       author='Nat Foster',
       author_email='nat.foster@gmail.com',
       license='BSD',
-      packages=['flask_alcohol'],
+      packages=['flask_alcohol', 'flask_alcohol.bench'],
       install_requires=[
           'flask_sqlalchemy',
       ],
+      entry_points={
+          'console_scripts': [
+              'flask-alcohol-bench = flask_alcohol.bench.api:main',
+          ],
+      },
       zip_safe=False)
\ No newline at end of file